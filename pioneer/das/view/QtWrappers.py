@@ -1,13 +1,20 @@
 from pioneer.common import clouds, linalg
 from pioneer.common.gui import Array, Product, Transforms, Geometry, Image
-from pioneer.das.api import categories, platform, sensors
+from pioneer.das.api import platform, sensors
+from pioneer.das.api.samples import Echo
+from pioneer.das.view import cloud_store
+from pioneer.das.view.accumulation import ACCUMULATION_POINTS_CAP, SweepAccumulator
+from pioneer.das.view.decimation import cached_voxel_decimation, TopAmplitudes
+from pioneer.das.view.picking import PickingTable
+from pioneer.das.view.point_colors import seg3d_colors, to_float_colors
+from pioneer.das.view.undistort import undistort_maps
 try:
     from pioneer.das.calibration import intrinsics
 except: pass
 
 from datetime import datetime
 from matplotlib import colors
-from PyQt5.QtCore import pyqtSlot as Slot, pyqtSignal as Signal, pyqtProperty as Property, Q_ENUMS, QVariant, QObject, QSize
+from PyQt5.QtCore import pyqtSlot as Slot, pyqtSignal as Signal, pyqtProperty as Property, Q_ENUMS, QVariant, QObject, QSize, QTimer
 from PyQt5.QtGui import QQuaternion, QVector2D, QVector3D, QMatrix4x4
 
 import cv2
@@ -18,6 +25,8 @@ import time
 This file contains a set of tools for future use.  They where used in the first version of the QML-based das viewer.
 '''
 
+REFINE_DELAY_MS = 500 # a decimated cloud is refined to full density once its sample has been shown this long
+
 class Platform(Product.Product):
     def __init__(self, parent = None, path = ''):
         super(Platform, self).__init__(parent)
@@ -199,7 +208,7 @@ class ExtractImage(Array.Array):
 
 
 
-class DasSampleToCloud(Array.ArrayDouble3):
+class DasSampleToCloud(Array.ArrayFloat3):
     def __init__(self, parent = None):
         super(DasSampleToCloud, self).__init__(parent)
         self._sample = None
@@ -220,6 +229,9 @@ class DasSampleToCloud(Array.ArrayDouble3):
         self._transform = Transforms.Transform()
         self._transform.set_producer(self)
 
+        self._pointsTransform = Transforms.Transform()
+        self._pointsTransform.set_producer(self)
+
         self._minAmplitude = np.nan
         self._maxAmplitude = np.nan
         self._hasReferential = True
@@ -229,6 +241,26 @@ class DasSampleToCloud(Array.ArrayDouble3):
 
         self._amplitudeRatio = 100
 
+        self._cloudKey = None
+        self._topAmplitudes = TopAmplitudes()
+        self._buffers = {}
+
+        self._accumulate = 1
+        self._accumulationPointsCap = ACCUMULATION_POINTS_CAP
+        self._accumulator = SweepAccumulator()
+
+        self._picking = None
+        self._pickEchoes = None # echo index of each vertex, for decimated point clouds
+        self._pointColors = None # colors of each point of the sample, gathered like the vertices
+
+        self._pointsBudget = 0
+        self._refineDelay = REFINE_DELAY_MS
+        self._lodSampleKey = None
+        self._refined = False
+        self._refineTimer = QTimer(self)
+        self._refineTimer.setSingleShot(True)
+        self._refineTimer.timeout.connect(self._refine)
+
         #call setters:
         self.method = 'get_point_cloud'
         self.sample = Product.VariantProduct()
@@ -264,6 +296,14 @@ class DasSampleToCloud(Array.ArrayDouble3):
 
     Product.InputProperty(vars(), bool, 'logScale')
 
+    Product.InputProperty(vars(), int, 'pointsBudget') # 0 for no limit
+
+    Product.InputProperty(vars(), int, 'refineDelay') # in ms, negative to never refine
+
+    Product.InputProperty(vars(), int, 'accumulate') # number of sweeps shown, requires an egomotion provider
+
+    Product.InputProperty(vars(), int, 'accumulationPointsCap')
+
 #outputs:
 
     Product.ConstProperty(vars(), Array.ArrayUInt1, 'indices')
@@ -274,6 +314,8 @@ class DasSampleToCloud(Array.ArrayDouble3):
 
     Product.ConstProperty(vars(), Transforms.Transform, 'transform')
 
+    Product.ConstProperty(vars(), Transforms.Transform, 'pointsTransform')
+
     Product.ROProperty(vars(), bool, 'hasReferential')
 
     Product.ROProperty(vars(), int, 'primitiveType')
@@ -281,48 +323,40 @@ class DasSampleToCloud(Array.ArrayDouble3):
 #slots:
     @Slot(int, result = int)
     def channel(self, n):
-        if self._primitiveType == Geometry.PrimitiveType.TRIANGLES:
-            triangle = self._triangle_at(n)
-            data  = self.filter_banks()
-            return data['indices'][clouds.triangle_to_echo_index(triangle)]
-        elif self._primitiveType == Geometry.PrimitiveType.POINTS:
-            return self.indices.ndarray[n]
-        else:
-            raise RuntimeError(f"Unsupported primitiveType {self._primitiveType}")
+        if self._picking is None:
+            if self._primitiveType == Geometry.PrimitiveType.POINTS:
+                return self.indices.ndarray[n]
+            raise RuntimeError("No echoes to pick from!")
+        return int(self._picking.table['channel'][self._echo_at(n)])
 
     @Slot(int, result = QVariant)
     def channelInfo(self, n):
-        triangle = self._triangle_at(n)
-        echo_i = clouds.triangle_to_echo_index(triangle)
-        sample = self._get_sample().masked
-        data = sample['data']
-        channel_i = data['indices'][echo_i]
-
-        h = sample['h']
-        try:
-            coeff = sample['timestamps_to_us_coeff']
-        except:
-            coeff = 1
-        rv = {'v': int(channel_i//h), 'h': int(channel_i%h), 'i' : int(channel_i)
-            , 'distance': float(data['distances'][echo_i])
-            , 'amplitude': float(data['amplitudes'][echo_i])
-            , 'timestamp': int(data['timestamps'][echo_i] * coeff)
-            , 'flag': int(data['flags'][echo_i])
-            , 'category': ''}
-
-        if self._seg3DSample._variant is not None:
-            seg_source = categories.get_source(self._seg3DSample._variant.datasource.ds_type)
-            category_number = self._seg3DSample._variant.raw['data'][int(echo_i)]['classes']
-            category_name, _ = categories.get_name_color(seg_source, category_number)
-            rv['category'] = category_name
-
-        return QVariant(rv)
+        if self._picking is None:
+            raise RuntimeError("No echoes to pick from!")
+        return QVariant(self._picking.info(self._echo_at(n)))
 
 # private:
 
+    def setPointColors(self, colors):
+        '''Per point colors of the sample (e.g. from an rgb field), as float colors, None to use amplitudes'''
+        self._pointColors = colors
+        self.makeDirty()
+
+    def _colored(self):
+        return self._seg3DSample._variant is not None or self._pointColors is not None
+
     def _triangle_at(self, n):
         return self._indices.ndarray[n * 3 : n * 3 + 3]
 
+    def _echo_at(self, n):
+        '''Row of the picking table of the n-th triangle or point'''
+        if self._primitiveType == Geometry.PrimitiveType.TRIANGLES:
+            return clouds.triangle_to_echo_index(self._triangle_at(n))
+        elif self._primitiveType == Geometry.PrimitiveType.POINTS:
+            return n if self._pickEchoes is None else self._pickEchoes[n]
+        else:
+            raise RuntimeError(f"Unsupported primitiveType {self._primitiveType}")
+
     def _normalize_amplitudes(self):
 
         min_ = self._minAmplitude if not np.isnan(self._minAmplitude) or self._amplitudes.ndarray.size == 0 else self._amplitudes.ndarray.min()
@@ -336,70 +370,161 @@ class DasSampleToCloud(Array.ArrayDouble3):
 
         self._amplitudes.ndarray = norm(self._amplitudes.ndarray + ((1 + min_) if self._logScale else 0))
 
-    def _get_sample(self):
-        if self._sample is None or self._sample._variant is None:
-            raise RuntimeError("No sample found!")
-        return self._sample._variant
+    def _decimate(self, sample, vertices):
+        '''Indices of the vertices to show, limited to the points budget until the sample is refined'''
+        if self._pointsBudget <= 0 or vertices.shape[0] <= self._pointsBudget:
+            return None
 
-    def _update(self):
+        sample_key = (sample.label, sample.index)
+        if sample_key != self._lodSampleKey:
+            self._lodSampleKey = sample_key
+            self._refined = False
+            if self._refineDelay >= 0:
+                self._refineTimer.start(self._refineDelay)
+        if self._refined:
+            return None
 
-        sample = self._get_sample()
+        return cached_voxel_decimation(self._cloudKey + (self._amplitudeRatio,), vertices, self._pointsBudget)
+
+    def _refine(self):
+        self._refined = True
+        self.makeDirty()
+
+    @Slot()
+    def invalidate(self):
+        '''To be called when the cloud returned by the sample changes, e.g. when extrinsics are edited'''
+        if self._undistort and self._sample is not None and self._sample._variant is not None:
+            cloud_store.invalidate(self._sample._variant.label, undistorted_only = True)
+        self._cloudKey = None
+        self._accumulator.clear()
+        self.makeDirty()
+
+    def _get_cloud(self, sample):
+        '''
+        Returns:
+            (rv, amplitudes, tf_Ref_from_Local, tf_Ref_from_Points), where rv is the result of sample.get_point_cloud()
+            or sample.quad_cloud() in the sensor local referential, shared with other actors through the cloud store,
+            and tf_Ref_from_Points brings it to the referential. If sweeps are accumulated, rv and amplitudes are those
+            of all sweeps, in the 'world' referential. Otherwise amplitudes is None.
+        '''
+        accumulate = self._accumulate if self._method == 'get_point_cloud' and sample.datasource.sensor.platform.egomotion_provider is not None else 1
+        if self._colored():
+            accumulate = 1 # colors are those of a single sweep
+        self._cloudKey = (sample.label, sample.index, self._method, self._referential, self._undistort, self._undistortRefTs, max(accumulate, 1), self._accumulationPointsCap)
 
-        f = getattr(sample, self._method) #point_cloud() or quad_cloud()
         tf_Ref_from_Local = linalg.tf_eye(np.float64)
+        tf_Ref_from_Points = linalg.tf_eye(np.float64)
+        amplitudes = None
 
         try:
-            rv = f(referential=self._referential, ignore_orientation=False, undistort=self._undistort, reference_ts=self._undistortRefTs, 
-                        dtype=np.float64)
+            if accumulate > 1:
+                rv, amplitudes = self._accumulator.update(sample.datasource, sample.index, accumulate, self._get_sweep
+                                                          , self._accumulationPointsCap, (self._undistort,))
+                tf_World_from_Local = sample.compute_transform('world', reference_ts = self._undistortRefTs if self._undistort else -1, dtype = np.float64)
+                tf_Ref_from_Points = sample.compute_transform(self._referential, dtype = np.float64) @ linalg.tf_inv(tf_World_from_Local)
+            else:
+                to_world = self._undistort and self._referential == 'world'
+                rv = cloud_store.get_local_cloud(sample, self._method, self._undistort, self._undistortRefTs, to_world)
+                if not to_world:
+                    tf_Ref_from_Points = sample.compute_transform(self._referential, ignore_orientation = False, reference_ts = self._undistortRefTs, dtype = np.float64)
             self.set_hasReferential(self, True)
             tf_Ref_from_Local = sample.compute_transform(self._referential, ignore_orientation = True, dtype = np.float64)
         except sensors.Sensor.NoPathToReferential as e:
-            rv = f(referential=None, undistort=self._undistort, dtype = np.float64)
+            rv = cloud_store.get_local_cloud(sample, self._method, self._undistort, self._undistortRefTs)
+            tf_Ref_from_Points = sample.compute_transform(None, dtype = np.float64)
+            amplitudes = None
             self.set_hasReferential(self, False)
 
+        return rv, amplitudes, tf_Ref_from_Local, tf_Ref_from_Points
+
+    def _get_sweep(self, sample):
+        '''Points of an accumulated sweep, in the 'world' referential, at the time of the sweep'''
+        points = cloud_store.compact(sample.get_point_cloud(referential = 'world', undistort = self._undistort, dtype = np.float64))
+        amplitudes = self._get_amplitudes(sample)
+        return points, np.ones(points.shape[0]) if amplitudes is None else amplitudes
+
+    def _get_amplitudes(self, sample):
+        '''Returns the field used to color a point cloud'''
+        candidates = [f for f in sample.fields if f not in ['x', 'y', 'z']]
+        if isinstance(sample.datasource.sensor, sensors.Lidar) and 'i' in candidates:
+            return sample.get_field('i')
+        elif len(candidates) > 0:
+            return sample.get_field(candidates[0])
+        return None
+
+    def _take(self, name, array, indices):
+        '''array[indices], written in a buffer reused across updates'''
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape[0] < indices.size or buffer.shape[1:] != array.shape[1:] or buffer.dtype != array.dtype:
+            buffer = self._buffers[name] = np.empty((array.shape[0],) + array.shape[1:], array.dtype)
+        return np.take(array, indices, axis = 0, out = buffer[:indices.size])
+
+    def _arange(self, n):
+        if self._buffers.get('indices', np.zeros(0)).size < n:
+            self._buffers['indices'] = np.arange(n, dtype = np.uint32)
+        return self._buffers['indices'][:n]
+
+    def _get_sample(self):
+        if self._sample is None or self._sample._variant is None:
+            raise RuntimeError("No sample found!")
+        return self._sample._variant
+
+    def _update(self):
+
+        sample = self._get_sample()
+
+        rv, accumulated_amp, tf_Ref_from_Local, tf_Ref_from_Points = self._get_cloud(sample)
+
+        self._picking = PickingTable(sample, self._seg3DSample._variant) if isinstance(sample, Echo) and accumulated_amp is None else None
+        self._pickEchoes = None
+
         self._transform.set_local_transform(QMatrix4x4(tf_Ref_from_Local.astype(np.float32).flatten().tolist()))
+        self._pointsTransform.set_local_transform(QMatrix4x4(tf_Ref_from_Points.astype(np.float32).flatten().tolist()))
         
         if self._method == "quad_cloud":
             v,a,i = rv
             self.set_ndarray(v)
             self._amplitudes.set_ndarray(a)
-            self._indices.set_ndarray(i)
+            if i is not self._indices.ndarray: # indices only depend on the number of echoes
+                self._indices.set_ndarray(i)
             self._normalize_amplitudes()
             
         elif self._method == "get_point_cloud":
 
-            # Choose which field is used to color the point cloud
-            candidates = [f for f in sample.fields if f not in ['x', 'y', 'z']]
-            if isinstance(sample.datasource.sensor, sensors.Lidar) and 'i' in candidates:
-                color_from_field = 'i'
-            elif len(candidates) > 0:
-                color_from_field = candidates[0]
-            else:
-                color_from_field = None
-            
-            if color_from_field is not None:
-                amp = sample.get_field(color_from_field)
+            amp = self._get_amplitudes(sample) if accumulated_amp is None else accumulated_amp
+            if amp is not None:
                 nb_points = np.max([1, int(amp.shape[0] * self._amplitudeRatio / 100.0)])
             else:
-                amp = np.ones(sample.size)
-                nb_points = sample.size
+                amp = np.ones(rv.shape[0])
+                nb_points = rv.shape[0]
 
             if self._amplitudeRatio < 100.0:
-                amp_order = np.argsort(amp)
-                self.set_ndarray(rv[amp_order][-nb_points:])
-                self._amplitudes.set_ndarray(amp[amp_order][-nb_points:])
-                self._indices.set_ndarray(np.arange(rv[amp_order][-nb_points:].shape[0], dtype = np.uint32))
+                top = self._topAmplitudes.top(self._cloudKey, amp, nb_points)
+                vertices, amp = self._take('vertices', rv, top), self._take('amplitudes', amp, top)
+                self._pickEchoes = top
             else:
-                self.set_ndarray(rv[-nb_points:])
-                self._amplitudes.set_ndarray(amp[-nb_points:])
-                self._indices.set_ndarray(np.arange(rv[-nb_points:].shape[0], dtype = np.uint32))
+                vertices = rv
+
+            keep = self._decimate(sample, vertices)
+            if keep is not None:
+                vertices, amp = vertices[keep], amp[keep]
+                self._pickEchoes = keep if self._pickEchoes is None else self._pickEchoes[keep]
+
+            self.set_ndarray(vertices)
+            self._amplitudes.set_ndarray(amp)
+            self._indices.set_ndarray(self._arange(vertices.shape[0]))
 
             if self._logScale and np.min(self._amplitudes.ndarray)< 0 :
                 self._amplitudes.set_ndarray(self._amplitudes.ndarray - np.min(self._amplitudes.ndarray))
             self._normalize_amplitudes()
 
-        if self._seg3DSample._variant is not None:
-            self._colors.set_ndarray(self._seg3DSample._variant.colors(self._method))
+        if self._colored():
+            if self._seg3DSample._variant is not None:
+                point_colors = to_float_colors(seg3d_colors(self._seg3DSample._variant, self._method))
+            else:
+                point_colors = self._pointColors
+            # same selection as the vertices (top amplitudes, then decimation)
+            self._colors.set_ndarray(point_colors if self._pickEchoes is None else self._take('colors', point_colors, self._pickEchoes))
 
 
 class ROSCalibratorFilter(Image.ImageFilter):
@@ -634,7 +759,10 @@ class Undistort(Image.ImageFilter):
                 mtx = calib['matrix']
                 dist = calib['distortion']
                 newcameramtx, self._roi=cv2.getOptimalNewCameraMatrix(mtx,dist,(w,h),1,(w,h))
-                self._map = cv2.initUndistortRectifyMap(mtx,dist,None,newcameramtx,(w,h),5)
+                x,y,roi_w,roi_h = self._roi
+                # only the valid region is remapped, no need to crop afterward (unless there is no valid region)
+                roi = (x,y,x+roi_w,y+roi_h) if roi_w > 0 and roi_h > 0 else None
+                self._map = undistort_maps(mtx,dist,newcameramtx,(w,h),roi=roi)
             except:
                 print(traceback.format_exc())
 
@@ -645,7 +773,4 @@ class Undistort(Image.ImageFilter):
             image = self._imageArray.ndarray
             if self._shape == image.shape[:2]:
 
-                dst = cv2.remap(image,self._map[0],self._map[1],cv2.INTER_LINEAR)
-                # crop the image
-                x,y,w,h = self._roi
-                self.ndarray = np.copy(dst[y:y+h, x:x+w])
\ No newline at end of file
+                self.ndarray = cv2.remap(image,self._map[0],self._map[1],cv2.INTER_LINEAR)
\ No newline at end of file
@@ -0,0 +1,66 @@
+import numpy as np
+
+'''
+Accumulation of the last sweeps of a point cloud datasource, fused in the 'world' referential.
+'''
+
+ACCUMULATION_POINTS_CAP = 2_000_000 # total, over all accumulated sweeps
+
+def even_subsample(n, max_n):
+    '''Indices of at most max_n evenly spread elements among n'''
+    if n <= max_n:
+        return np.arange(n)
+    return np.linspace(0, n - 1, max_n).astype('i8')
+
+
+class SweepAccumulator(object):
+    '''Ring buffer of the last sweeps of a datasource, each one transformed once, when it enters the buffer.
+    Stepping forward by one sample only transforms the newest sweep and evicts the oldest.
+    '''
+    def __init__(self):
+        self.sweeps = {} # sample index -> (points, amplitudes)
+        self.key = None
+        self.cloud = None
+        self.buffers = (np.zeros((0, 3)), np.zeros(0))
+
+    def clear(self):
+        self.sweeps.clear()
+        self.key = None
+        self.cloud = None
+
+    def update(self, datasource, index, n_sweeps, get_sweep, max_points = ACCUMULATION_POINTS_CAP, params = ()):
+        '''
+        Args:
+            datasource - the sweeps are datasource[index - n_sweeps + 1 : index + 1]
+            get_sweep - f(sample) -> ((N,3) points in a common referential, (N,) amplitudes)
+            max_points - total points cap, each sweep is evenly subsampled to max_points // n_sweeps
+            params - anything get_sweep() depends on, the buffer is cleared when they change
+        Returns:
+            (points, amplitudes) of all sweeps, from the oldest to the newest
+        '''
+        n_sweeps = max(int(n_sweeps), 1)
+        per_sweep = max(int(max_points) // n_sweeps, 1)
+        indices = range(max(index - n_sweeps + 1, 0), index + 1)
+        key = (indices.start, indices.stop, per_sweep, params)
+        if key == self.key:
+            return self.cloud
+        if self.key is None or self.key[2:] != key[2:]:
+            self.sweeps.clear()
+        self.key = key
+
+        for i in [i for i in self.sweeps if i not in indices]:
+            del self.sweeps[i]
+        for i in indices:
+            if i not in self.sweeps:
+                points, amplitudes = get_sweep(datasource[i])
+                keep = even_subsample(points.shape[0], per_sweep)
+                self.sweeps[i] = (points[keep], amplitudes[keep])
+
+        sweeps = [self.sweeps[i] for i in indices]
+        n = sum(points.shape[0] for points, _ in sweeps)
+        points_buffer, amplitudes_buffer = self.buffers
+        if points_buffer.shape[0] < n or points_buffer.dtype != sweeps[-1][0].dtype or amplitudes_buffer.dtype != sweeps[-1][1].dtype:
+            self.buffers = points_buffer, amplitudes_buffer = (np.empty((n, 3), sweeps[-1][0].dtype), np.empty(n, sweeps[-1][1].dtype))
+        self.cloud = (np.concatenate([points for points, _ in sweeps], out = points_buffer[:n])
+                    , np.concatenate([amplitudes for _, amplitudes in sweeps], out = amplitudes_buffer[:n]))
+        return self.cloud
@@ -14,10 +14,13 @@ Options:
   --add_sync=<source>    given source will also be synchronized [default: ]
   --video_recording_enable        desactivate the qt multi-threading, and then enable frame grabing for video recording
   --video_fps=<int>      force video fps to a specific value, else compute from datasource timestamps
+  --persist_traces       store processed traces next to the dataset, filled in the background, reused by later sessions
+  --persist_undistort_maps        store camera undistortion maps next to the dataset, reused by later sessions
 -l, --log                activate das.api logger
 """
 
 from pioneer.das.api import platform
+from pioneer.das.view import trace_cache, undistort
 from pioneer.das.view.viewer import Viewer
 
 import docopt
@@ -45,6 +48,8 @@ def main():
     add_sync = None if add_sync==[''] else int(add_sync)
     video_fps = args['--video_fps']
     use_logger = args['--log']
+    trace_cache.PERSIST_PROCESSED_TRACES = args['--persist_traces']
+    undistort.PERSIST_MAPS = args['--persist_undistort_maps']
 
     if args['--video_recording_enable']:
       
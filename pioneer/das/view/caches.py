@@ -0,0 +1,86 @@
+from collections import OrderedDict
+
+import numpy as np
+import threading
+
+def nbytes(value):
+    '''Approximate memory footprint of a cached value (numpy arrays only, recursively)'''
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(nbytes(v) for v in value.values())
+    return 0
+
+class LRUCache(object):
+    '''Thread-safe least-recently-used cache, bounded by a number of items and/or a memory budget (in bytes).
+    If given, on_evict(key, value) is called for entries evicted to respect these bounds.
+    '''
+    def __init__(self, max_items = None, max_bytes = None, on_evict = None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._nbytes = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._nbytes
+
+    def get(self, key, default = None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        size = nbytes(value)
+        with self._lock:
+            if self.max_bytes is not None and size > self.max_bytes:
+                return value
+            self.pop(key)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._nbytes += size
+            self._evict()
+        return value
+
+    def pop(self, key, default = None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._nbytes -= self._sizes.pop(key)
+            return self._entries.pop(key)
+
+    def invalidate(self, predicate):
+        '''Removes all entries whose key satisfies predicate(key)'''
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._nbytes = 0
+
+    def _evict(self):
+        while len(self._entries) > 1 and (
+               (self.max_items is not None and len(self._entries) > self.max_items)
+            or (self.max_bytes is not None and self._nbytes > self.max_bytes)):
+            key = next(iter(self._entries))
+            value = self.pop(key)
+            if self.on_evict is not None:
+                self.on_evict(key, value)
@@ -0,0 +1,57 @@
+from pioneer.das.view.caches import LRUCache
+from pioneer.das.view.quad_cloud import has_quad_directions, quad_cloud
+
+import numpy as np
+
+'''
+Process-wide store of sample clouds in their sensor local referential, computed once and shared by every actor
+displaying them. Actors bring them to their referential with a transform matrix, so that another viewport, or an
+extrinsics edit, only costs a 4x4 matrix.
+'''
+
+CLOUD_STORE_BYTES = 512 * 2**20
+COMPACT_CLOUDS = True # store float32 points, referentials are still computed in float64, on the transform matrices
+
+CLOUD_STORE = LRUCache(max_bytes = CLOUD_STORE_BYTES)
+
+def get_local_cloud(sample, method, undistort = False, reference_ts = -1, to_world = False):
+    '''Cached sample.get_point_cloud() or sample.quad_cloud(), with referential=None and ignore_orientation=True
+
+    Args:
+        method - 'get_point_cloud' or 'quad_cloud'
+        undistort, reference_ts - motion compensation, as in sample.get_point_cloud()
+        to_world - if True (requires undistort), motion compensated points are left in the 'world' referential
+    '''
+    key = (sample.label, sample.index, method, undistort, reference_ts if undistort else -1, to_world and undistort)
+    rv = CLOUD_STORE.get(key)
+    if rv is None:
+        rv = CLOUD_STORE.put(key, _compute_local_cloud(sample, method, undistort, reference_ts, to_world and undistort))
+    return rv
+
+def invalidate(datasource, undistorted_only = False):
+    '''Drops the clouds of a datasource, e.g. undistorted ones when the extrinsics, thus the motion compensation, change'''
+    CLOUD_STORE.invalidate(lambda key: key[0] == datasource and (key[3] or not undistorted_only))
+
+def compact(points):
+    '''points as float32, if COMPACT_CLOUDS'''
+    return points.astype(np.float32, copy = False) if COMPACT_CLOUDS else points
+
+def _compute_local_cloud(sample, method, undistort, reference_ts, to_world):
+    # motion compensation is done in float64
+    dtype = np.float32 if COMPACT_CLOUDS and not undistort else np.float64
+    sensor = sample.datasource.sensor
+    if method != 'quad_cloud' or not has_quad_directions(sensor):
+        f = getattr(sample, method) #point_cloud() or quad_cloud()
+        rv = f(referential = 'world' if to_world else None, ignore_orientation = True, undistort = undistort, reference_ts = reference_ts
+                 , dtype = dtype)
+        if method == 'quad_cloud':
+            return (compact(rv[0]),) + tuple(rv[1:])
+        return compact(rv)
+
+    quad_directions = sensor.get_corrected_projection_data(sample.timestamp, sample.cache(), type = 'quad_directions')
+    pts_Local, quad_amplitudes, quad_indices = quad_cloud(sample.indices, sample.distances, sample.amplitudes, quad_directions, dtype)
+    if undistort:
+        # four points per quad, 1 different direction per point, same distance for each
+        sample.undistort_points(pts_Local, np.tile(sample.timestamps, 4), reference_ts, to_world, dtype = np.float64)
+        pts_Local = compact(pts_Local)
+    return pts_Local, quad_amplitudes, quad_indices
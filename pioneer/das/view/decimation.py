@@ -0,0 +1,119 @@
+from pioneer.das.view.caches import LRUCache
+
+import numpy as np
+
+'''
+Point reduction for dense point clouds: vectorized voxel-grid decimation down to a points budget, and selection of
+the points with the highest amplitudes.
+'''
+
+DECIMATION_CACHE_SIZE = 64 # (sample, budget) pairs
+MORTON_BITS = 21 # per axis, so that codes fit in 63 bits
+
+DECIMATION_CACHE = LRUCache(max_items = DECIMATION_CACHE_SIZE)
+
+def _spread_bits(v):
+    '''Inserts two zero bits between each of the 21 lower bits of v'''
+    v = v & np.uint64(0x1fffff)
+    for shift, mask in [(32, 0x1f00000000ffff), (16, 0x1f0000ff0000ff), (8, 0x100f00f00f00f00f), (4, 0x10c30c30c30c30c3), (2, 0x1249249249249249)]:
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+def morton_codes(points):
+    '''(N,) Z-order codes of points quantized on a cubic grid of 2**MORTON_BITS cells per side.
+    Dropping the 3*L lower bits of a code gives the code of its voxel in a grid 2**L times coarser.
+    '''
+    lo = points.min(axis=0)
+    extent = max(float((points.max(axis=0) - lo).max()), 1e-6)
+    cells = ((points - lo) * ((2**MORTON_BITS - 1) / extent)).astype('u8')
+    return _spread_bits(cells[:,0]) | (_spread_bits(cells[:,1]) << np.uint64(1)) | (_spread_bits(cells[:,2]) << np.uint64(2))
+
+def voxel_decimation(points, budget):
+    '''Indices of at most 'budget' points, one per voxel of the finest octree level whose occupied voxels fit in the budget,
+    completed with evenly spread points of the next finer level. Dense regions (e.g. near the sensor) are thinned
+    while sparse regions are kept, unlike a uniform subsampling. A single sort is needed for all levels.
+
+    Args:
+        points - (N,3) coordinates
+        budget - maximum number of points to keep
+    Returns:
+        sorted (M,) indices, M <= budget
+    '''
+    n = points.shape[0]
+    if n <= budget:
+        return np.arange(n)
+    if budget <= 0:
+        return np.zeros(0, 'i8')
+
+    finite = np.where(np.isfinite(points).all(axis=1))[0]
+    if finite.size <= budget:
+        return finite
+    codes = morton_codes(points[finite])
+    order = np.argsort(codes)
+    codes = codes[order]
+
+    def representatives(level):
+        voxels = codes >> np.uint64(3 * level)
+        first = np.ones(codes.size, bool)
+        first[1:] = voxels[1:] != voxels[:-1]
+        return np.flatnonzero(first)
+
+    fine = representatives(0)
+    if fine.size <= budget:
+        return np.sort(finite[order[fine]])
+    for level in range(1, MORTON_BITS + 1):
+        coarse = representatives(level)
+        if coarse.size <= budget:
+            break
+        fine = coarse
+
+    # the first point of a coarse voxel is also the first of one of its finer voxels
+    is_coarse = np.zeros(codes.size, bool)
+    is_coarse[coarse] = True
+    extra = fine[~is_coarse[fine]]
+    extra = extra[np.linspace(0, extra.size - 1, budget - coarse.size).astype('i8')]
+    keep = np.concatenate([coarse, extra])
+    return np.sort(finite[order[keep]])
+
+def cached_voxel_decimation(key, points, budget):
+    '''voxel_decimation(), cached by (key, budget). The key must identify the points, e.g. (datasource, index)'''
+    indices = DECIMATION_CACHE.get((key, budget))
+    if indices is None or (indices.size > 0 and indices[-1] >= points.shape[0]):
+        indices = DECIMATION_CACHE.put((key, budget), voxel_decimation(points, budget))
+    return indices
+
+
+class TopAmplitudes(object):
+    '''Indices of the k highest amplitudes of a cloud. A first query costs a np.argpartition(), further queries on the
+    same amplitudes (e.g. while a ratio slider is dragged) compute the full ordering once, then only slice it.
+    '''
+    def __init__(self):
+        self.key = None
+        self.order = None
+        self.last = (None, None)
+
+    def top(self, key, amplitudes, k):
+        '''
+        Args:
+            key - identifies the amplitudes, e.g. (datasource, index, field)
+            amplitudes - (N,) array
+            k - number of indices to return
+        Returns:
+            (k,) indices, in increasing amplitude order once the full ordering is cached
+        '''
+        n = amplitudes.shape[0]
+        k = min(max(int(k), 0), n)
+        if key != self.key:
+            self.key, self.order = key, None
+            if k == n or k == 0:
+                indices = np.arange(n - k, n)
+            else:
+                indices = np.argpartition(amplitudes, n - k)[n - k:]
+        elif self.last[0] == k:
+            return self.last[1]
+        else:
+            if self.order is None:
+                self.order = np.argsort(amplitudes, kind = 'stable')
+            indices = self.order[n - k:]
+        self.last = (k, indices)
+        return indices
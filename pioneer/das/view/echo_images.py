@@ -0,0 +1,49 @@
+from pioneer.common import images
+from pioneer.das.view.caches import LRUCache
+
+import numpy as np
+
+'''
+Per-frame images of echo samples, computed in a single pass for all the image types of the traces window, and the
+channel indices grid of placeholder echoes, per sensor specs.
+'''
+
+ECHO_IMAGES_CACHE_SIZE = 16 # echo samples
+PLACEHOLDER_INDICES_CACHE_SIZE = 8 # (v, h) specs
+
+IMAGE_FIELDS = {'amplitude': 'amplitudes', 'distance': 'distances', 'width': 'widths', 'skew': 'skews'}
+
+ECHO_IMAGES = LRUCache(max_items = ECHO_IMAGES_CACHE_SIZE)
+PLACEHOLDER_INDICES = LRUCache(max_items = PLACEHOLDER_INDICES_CACHE_SIZE)
+
+def echo_images(sample, dtype = np.float32):
+    '''Images of the strongest echo of each channel, cached per sample.
+
+    Returns:
+        a dict with keys 'amplitude', 'distance', 'width' and 'skew', the same images as amplitude_img(),
+        distance_img(options='max_amplitude') and other_field_img('widths'|'skews'). Fields missing from the sample
+        give an image of zeros.
+    '''
+    key = (sample.datasource.label, sample.index, np.dtype(dtype).str)
+    rv = ECHO_IMAGES.get(key)
+    if rv is not None:
+        return rv
+
+    data = sample.data
+    fields = [f for f in IMAGE_FIELDS.values() if f != 'amplitudes' and f in data.dtype.names]
+    amplitudes, others = images.extrema_image(sample.v, sample.h, data, sort_field='amplitudes', sort_direction=-1
+                                              , other_fields=fields, dtype=dtype)
+    others['amplitudes'] = amplitudes
+
+    rv = {}
+    for name, field in IMAGE_FIELDS.items():
+        image = others.get(field)
+        rv[name] = sample.transform_image(np.zeros((sample.v, sample.h), dtype) if image is None else image)
+    return ECHO_IMAGES.put(key, rv)
+
+def placeholder_indices(v, h):
+    '''Channel indices of a v x h sensor, in the order placeholder echoes are made (rows flipped)'''
+    indices = PLACEHOLDER_INDICES.get((v, h))
+    if indices is None:
+        indices = PLACEHOLDER_INDICES.put((v, h), np.ascontiguousarray(np.flipud(np.arange(v*h, dtype='u4').reshape(v, h)).ravel()))
+    return indices
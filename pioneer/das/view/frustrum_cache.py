@@ -0,0 +1,98 @@
+from pioneer.common import clouds
+from pioneer.common.logging_manager import LoggingManager
+from pioneer.das.view.caches import LRUCache
+
+import hashlib
+import numpy as np
+import os
+
+'''
+Process-wide cache of the frustrum line geometry of LCAx sensors, shared by every viewport window. With an angle chart
+and no mirror temperature compensation, the geometry is also persisted on disk, keyed by a hash of the angle chart file
+and of the intrinsics it depends on, so that it is only rebuilt when they change.
+'''
+
+FRUSTRUM_CACHE_SIZE = 32 # (sensor, specs, intrinsics) tuples
+FRUSTRUM_SCALE = 40
+PERSIST_FRUSTRUMS = True
+FRUSTRUM_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'pioneer.das.view', 'frustrums')
+
+FRUSTRUM_CACHE = LRUCache(max_items = FRUSTRUM_CACHE_SIZE)
+
+def _specs_key(specs):
+    return tuple(specs[k] for k in ['v', 'h', 'v_fov', 'h_fov'])
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+def _intrinsics_key(sensor):
+    return (getattr(sensor, 'factor_correction', 1), getattr(sensor, 'angle_chart_ref_v_fov', None)
+          , repr(getattr(sensor, 'mirror_temp_compensation', None)))
+
+def frustrum_geometry(sample):
+    '''Cached clouds.frustrum() of an 'ech' sample's sensor, in its local referential, before sample.orientation
+
+    Returns:
+        (indices, vertices), the same arrays for every sample of a sensor, as long as its intrinsics do not change
+    '''
+    sensor = sample.datasource.sensor
+    specs = sample.specs
+    angle_chart_path = getattr(sensor, 'angle_chart_path', None) if getattr(sensor, 'angle_chart', None) else None
+
+    key = (sensor.name, _specs_key(specs), angle_chart_path, None if angle_chart_path is None else _file_stamp(angle_chart_path)
+         , _intrinsics_key(sensor))
+    geometry = FRUSTRUM_CACHE.get(key)
+    if geometry is not None:
+        return geometry
+
+    if angle_chart_path is None:
+        geometry = clouds.frustrum(clouds.frustrum_directions(specs['v_fov'], specs['h_fov'], dtype=np.float64))
+    else:
+        # with a mirror temperature compensation, the geometry depends on the recording: it is not persisted
+        path = None if getattr(sensor, 'mirror_temp_compensation', None) else _frustrum_path(angle_chart_path, key)
+        geometry = _load_frustrum(path)
+        if geometry is None:
+            geometry = _compute_frustrum(sample)
+            _save_frustrum(path, geometry)
+    return FRUSTRUM_CACHE.put(key, geometry)
+
+def _compute_frustrum(sample):
+    # with a mirror temperature compensation, the angles of the first sample are used for every window
+    correct_v_angles = sample.datasource.sensor.get_corrected_projection_data(sample.timestamp, sample.cache(), 'angles')
+    v_cell_size, h_cell_size = clouds.v_h_cell_size_rad(sample.specs)
+    return clouds.frustrum(clouds.custom_frustrum_directions(correct_v_angles, v_cell_size, h_cell_size, dtype=np.float64), FRUSTRUM_SCALE)
+
+def _frustrum_path(angle_chart_path, key):
+    if not PERSIST_FRUSTRUMS:
+        return None
+    try:
+        with open(angle_chart_path, 'rb') as f:
+            digest = hashlib.sha1(f.read())
+    except OSError as e:
+        LoggingManager.instance().warning(f'Could not read angle chart {angle_chart_path}: {e}')
+        return None
+    digest.update(repr((key[1], key[4], FRUSTRUM_SCALE)).encode())
+    return os.path.join(FRUSTRUM_DIRECTORY, digest.hexdigest() + '.npz')
+
+def _load_frustrum(path):
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as f:
+            return f['indices'], f['vertices']
+    except Exception as e:
+        LoggingManager.instance().warning(f'Could not load frustrum from {path}: {e}')
+        return None
+
+def _save_frustrum(path, geometry):
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        np.savez(path, indices = geometry[0], vertices = geometry[1])
+    except Exception as e:
+        LoggingManager.instance().warning(f'Could not save frustrum to {path}: {e}')
@@ -0,0 +1,56 @@
+import numpy as np
+
+'''
+Batched versions of geometry helpers used to draw annotations.
+'''
+
+# Same corner ordering as pioneer.common.linalg.bbox_to_8coordinates
+BOX_CORNERS_SIGNS = np.array([[-1,-1,-1]
+                            , [-1,-1, 1]
+                            , [-1, 1,-1]
+                            , [-1, 1, 1]
+                            , [ 1,-1,-1]
+                            , [ 1,-1, 1]
+                            , [ 1, 1,-1]
+                            , [ 1, 1, 1]], dtype = 'f8')
+
+# Closed polygons for the 6 faces of a box, indexing the corners above
+BOX_FACES = np.array([[0,1,3,2,0]
+                    , [0,1,5,4,0]
+                    , [0,2,6,4,0]
+                    , [7,3,1,5,7]
+                    , [7,5,4,6,7]
+                    , [7,6,2,3,7]])
+
+def euler_to_matrices(r_xyz):
+    '''(N,3) roll, pitch, yaw in radians -> (N,3,3) rotation matrices (static 'sxyz' axes, like transforms3d.euler.euler2mat)'''
+    r_xyz = np.asarray(r_xyz, dtype = 'f8').reshape(-1, 3)
+    cx, cy, cz = np.cos(r_xyz).T
+    sx, sy, sz = np.sin(r_xyz).T
+
+    matrices = np.empty((r_xyz.shape[0], 3, 3), dtype = 'f8')
+    matrices[:,0,0] = cz*cy
+    matrices[:,0,1] = cz*sy*sx - sz*cx
+    matrices[:,0,2] = cz*sy*cx + sz*sx
+    matrices[:,1,0] = sz*cy
+    matrices[:,1,1] = sz*sy*sx + cz*cx
+    matrices[:,1,2] = sz*sy*cx - cz*sx
+    matrices[:,2,0] = -sy
+    matrices[:,2,1] = cy*sx
+    matrices[:,2,2] = cy*cx
+    return matrices
+
+def bboxes_to_8coordinates(c_xyz, d_xyz, r_xyz):
+    '''Batched pioneer.common.linalg.bbox_to_8coordinates
+
+    Args:
+        c_xyz: (N,3) centers of the boxes
+        d_xyz: (N,3) dimensions x,y,z (length,width,height) of the boxes
+        r_xyz: (N,3) roll pitch yaw rotations in radians
+    Returns:
+        (N,8,3) coordinates
+    '''
+    c_xyz = np.asarray(c_xyz, dtype = 'f8').reshape(-1, 3)
+    d_xyz = np.asarray(d_xyz, dtype = 'f8').reshape(-1, 3)
+    local = BOX_CORNERS_SIGNS[None,:,:] * d_xyz[:,None,:] / 2
+    return np.einsum('nij,nkj->nki', euler_to_matrices(r_xyz), local) + c_xyz[:,None,:]
@@ -0,0 +1,95 @@
+from pioneer.das.api import categories
+from pioneer.das.view.caches import LRUCache
+
+import numpy as np
+
+'''
+Per-frame lookups of echo samples: a picking table gathering everything the viewport cursor shows about an echo, and
+a channel -> echoes index, both built once per frame so that hovering is a single lookup.
+'''
+
+CHANNEL_ECHOES_CACHE_SIZE = 16 # echo samples
+
+PICKING_DTYPE = np.dtype([('channel', 'i8'), ('v', 'i8'), ('h', 'i8'), ('distance', 'f8'), ('amplitude', 'f8')
+                        , ('timestamp', 'i8'), ('flag', 'i8'), ('category', 'i8')])
+
+NO_CATEGORY = -1
+
+CHANNEL_ECHOES = LRUCache(max_items = CHANNEL_ECHOES_CACHE_SIZE)
+
+def channel_echoes(sample):
+    '''Cached ChannelEchoes of an echo sample, shared by every window looking up its channels'''
+    key = (sample.datasource.label, sample.index)
+    lookup = CHANNEL_ECHOES.get(key)
+    if lookup is None:
+        lookup = CHANNEL_ECHOES.put(key, ChannelEchoes(sample.indices, sample.v * sample.h))
+    return lookup
+
+
+class PickingTable(object):
+    '''Rows of the echoes of a sample (after its mask), optionally completed with their 3D segmentation category'''
+
+    def __init__(self, sample, seg_sample = None):
+        masked = sample.masked
+        data = masked['data']
+        h = masked['h']
+        try:
+            coeff = masked['timestamps_to_us_coeff']
+        except:
+            coeff = 1
+
+        n = data.shape[0]
+        self.table = table = np.empty(n, PICKING_DTYPE)
+        table['channel'] = data['indices']
+        table['v'], table['h'] = np.divmod(table['channel'], h)
+        table['distance'] = data['distances']
+        table['amplitude'] = data['amplitudes']
+        table['timestamp'] = data['timestamps'] * coeff
+        table['flag'] = data['flags']
+        table['category'] = NO_CATEGORY
+
+        self.category_names = {NO_CATEGORY: ''}
+        if seg_sample is not None:
+            classes = seg_sample.raw['data']['classes'][:n]
+            table['category'][:classes.shape[0]] = classes
+            seg_source = categories.get_source(seg_sample.datasource.ds_type)
+            for c in np.unique(classes):
+                self.category_names[int(c)] = categories.get_name_color(seg_source, c)[0]
+
+    def __len__(self):
+        return self.table.shape[0]
+
+    def info(self, echo_i):
+        '''Cursor information of an echo, as a dict'''
+        row = self.table[echo_i]
+        return {'v': int(row['v']), 'h': int(row['h']), 'i' : int(row['channel'])
+              , 'distance': float(row['distance'])
+              , 'amplitude': float(row['amplitude'])
+              , 'timestamp': int(row['timestamp'])
+              , 'flag': int(row['flag'])
+              , 'category': self.category_names[int(row['category'])]}
+
+
+class ChannelEchoes(object):
+    '''Channel -> echoes index, CSR-style: the echoes of channel c are order[offsets[c]:offsets[c+1]], so channels with
+    several echoes (or none) are supported.
+    '''
+    def __init__(self, indices, n_channels):
+        '''
+        Args:
+            indices - (N,) channel index of each echo
+            n_channels - v * h
+        '''
+        indices = np.asarray(indices, 'i8')
+        self.order = np.argsort(indices, kind = 'stable')
+        self.offsets = np.zeros(max(n_channels, indices.max() + 1 if indices.size > 0 else 0) + 1, 'i8')
+        np.cumsum(np.bincount(indices, minlength = self.offsets.size - 1), out = self.offsets[1:])
+
+    def echoes(self, channel):
+        '''Indices of the echoes of a channel, in the order of the sample'''
+        if channel < 0 or channel >= self.offsets.size - 1:
+            return self.order[:0]
+        return self.order[self.offsets[channel]:self.offsets[channel + 1]]
+
+    def count(self, channel):
+        return len(self.echoes(channel))
@@ -0,0 +1,34 @@
+from pioneer.common import platform as platform_utils
+from pioneer.das.api import categories
+
+import numpy as np
+
+'''
+Compact (uint8 RGBA) colors of point clouds. The 3D renderer only takes float32 vertex attributes, so colors are
+expanded to float32 once, when given to an actor.
+'''
+
+def rgb_field_colors(sample):
+    '''(N,4) uint8 RGBA colors of a point cloud with 'r', 'g' and 'b' fields'''
+    colors = np.full((sample.size, 4), 255, 'u1')
+    for channel, field in enumerate('rgb'):
+        colors[:,channel] = sample.get_field(field)
+    return colors
+
+def seg3d_colors(seg_sample, mode = None):
+    '''uint8 RGBA version of Seg3d.colors()'''
+    seg_source = categories.get_source(platform_utils.parse_datasource_name(seg_sample.datasource.label)[2])
+    classes, inverse = np.unique(seg_sample.raw['data']['classes'], return_inverse = True)
+
+    palette = np.full((classes.size, 4), 255, 'u1')
+    for i, c in enumerate(classes):
+        palette[i,:3] = categories.get_name_color(seg_source, c)[1]
+    colors = palette[inverse.ravel()]
+
+    if mode == 'quad_cloud':
+        colors = np.tile(colors, (4, 1)) # same layout as clouds.quad_stack()
+    return colors
+
+def to_float_colors(colors):
+    '''(N,4) uint8 RGBA -> float32 in [0,1]'''
+    return np.multiply(colors, np.float32(1/255), dtype = 'f4')
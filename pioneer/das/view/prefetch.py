@@ -0,0 +1,91 @@
+from pioneer.das.view import undistort as und
+from pioneer.das.view.caches import LRUCache
+
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_LOOK_AHEAD = 8
+DEFAULT_WORKERS = 2
+DEFAULT_FRAME_CACHE_BYTES = 512 * 2**20 # 512 MB, shared by all imager windows
+
+FRAME_CACHE = LRUCache(max_bytes = DEFAULT_FRAME_CACHE_BYTES) # key -> (image, full resolution shape)
+
+class ImagePrefetcher(object):
+    '''Decodes the images of a camera datasource ahead of the cursor, in the current play direction.
+
+    Decoded images land in a shared, memory-budgeted frame cache keyed by (datasource, index, undistort, roi, scale),
+    with the shape of the full resolution image, so that overlays can be projected without decoding the image again.
+    Samples are only instantiated on the calling (GUI) thread, as DatasourceWrapper's sample cache is not thread-safe,
+    workers only decode them.
+    '''
+    def __init__(self, platform, datasource, cache = FRAME_CACHE, look_ahead = DEFAULT_LOOK_AHEAD, n_workers = DEFAULT_WORKERS, maps_directory = None):
+        self.platform = platform
+        self.datasource = datasource
+        self.cache = cache
+        self.look_ahead = look_ahead
+        self.n_workers = n_workers
+        self.maps_directory = maps_directory
+        self.direction = 1
+        self.last_cursor = None
+        self.futures = {}
+        self.executor = None
+
+    def sample(self, index):
+        return self.platform[self.datasource][index]
+
+    def get_image(self, index, undistort, roi = None, scale = 1):
+        '''
+        Args:
+            roi - optional (x0, y0, x1, y1), only this region of the (scaled) image is returned
+            scale - the image is decoded at this fraction of its full resolution
+        Returns:
+            (image, shape), shape being the one of the full resolution image
+        '''
+        key = (self.datasource, index, undistort, roi, scale)
+        frame = self.cache.get(key)
+        if frame is None:
+            frame = self.cache.put(key, self._get_image(self.sample(index), undistort, roi, scale))
+        return frame
+
+    def prefetch(self, cursor, undistort, roi = None, scale = 1):
+        if self.look_ahead <= 0 or self.platform.is_live():
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers = self.n_workers)
+
+        if self.last_cursor is not None and cursor != self.last_cursor:
+            self.direction = 1 if cursor > self.last_cursor else -1
+        self.last_cursor = cursor
+
+        n = len(self.platform[self.datasource])
+        wanted = [(self.datasource, i, undistort, roi, scale) for i in (cursor + self.direction * k for k in range(1, self.look_ahead + 1)) if 0 <= i < n]
+
+        for key in list(self.futures):
+            if key not in wanted:
+                self.futures.pop(key).cancel()
+
+        for key in wanted:
+            if key in self.futures and not self.futures[key].done():
+                continue
+            self.futures.pop(key, None)
+            if key not in self.cache:
+                self.futures[key] = self.executor.submit(self._decode, key, self.sample(key[1]))
+
+    def shutdown(self):
+        '''Cancels pending decodes and stops the workers, prefetching restarts on the next prefetch()'''
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+        if self.executor is not None:
+            self.executor.shutdown(wait = False)
+            self.executor = None
+
+    def _get_image(self, sample, undistort, roi, scale):
+        image, shape = und.decode_image(sample, undistort, roi, self.maps_directory, scale)
+        if roi is not None and not (undistort and und.has_pinhole_model(sample)):
+            image = image.copy() # a view would keep the whole raw image alive in the cache
+        return image, shape
+
+    def _decode(self, key, sample):
+        _, _, undistort, roi, scale = key
+        if key not in self.cache:
+            self.cache.put(key, self._get_image(sample, undistort, roi, scale))
@@ -0,0 +1,46 @@
+from pioneer.das.api.samples.image import Image
+from pioneer.das.api.samples.image_fisheye import ImageFisheye
+from pioneer.das.view.undistort import und_camera_matrix
+
+import cv2
+import numpy as np
+
+'''
+Projection of 3D points in camera images of a known shape (e.g. the one of the prefetched frame). Image.project_pts()
+reads the sample's shape, thus decodes its image, to build the fov mask and the undistorted intrinsics. These helpers
+take the shape instead, so that overlays can be projected while the image is decoded by the prefetcher.
+'''
+
+def projection_mask(pts, projection, shape, margin = 0):
+    '''Same as Image.projection_mask(), for an image of the given shape'''
+    v, h = shape[:2]
+    return (pts[:,2] > 0) \
+         & (projection[:,0] >= 0 - margin) & (projection[:,0] < h + margin) \
+         & (projection[:,1] >= 0 - margin) & (projection[:,1] < v + margin)
+
+def project_pts(sample, pts, shape, undistorted = False, margin = 0):
+    '''Same as sample.project_pts(pts, mask_fov=False, output_mask=True, undistorted=undistorted, margin=margin)
+
+    Args:
+        shape - shape of the full resolution image of the sample
+    Returns:
+        (image_pts, mask)
+    '''
+    R = T = np.zeros((3, 1))
+    if type(sample) is Image:
+        A = und_camera_matrix(sample.camera_matrix, sample.distortion_coeffs, (shape[1], shape[0]))
+        und_image_pts = np.squeeze(cv2.projectPoints(pts, R, T, A, np.zeros((5,1)))[0])
+    elif type(sample) is ImageFisheye:
+        und_image_pts = np.squeeze(sample.datasource.sensor.mercator_projection.project_pts(pts))
+    else:
+        # e.g. ImageCylinder, whose projection does not depend on the image
+        return sample.project_pts(pts, mask_fov=False, output_mask=True, undistorted=undistorted, margin=margin)
+
+    if undistorted:
+        image_pts = und_image_pts
+    elif type(sample) is Image:
+        image_pts = np.squeeze(cv2.projectPoints(pts, R, T, sample.camera_matrix, sample.distortion_coeffs)[0])
+    else:
+        image_pts = np.squeeze(cv2.fisheye.projectPoints(pts.reshape((-1,1,3)), R, T, sample.camera_matrix, sample.distortion_coeffs)[0])
+
+    return image_pts, projection_mask(pts, und_image_pts, shape, margin)
@@ -17,6 +17,8 @@ Actors {
     property alias minAmplitude : cloud_.minAmplitude 
     property alias maxAmplitude : cloud_.maxAmplitude 
     property alias amplitudeRatio : cloud_.amplitudeRatio 
+    property alias pointsBudget : cloud_.pointsBudget
+    property alias accumulate : cloud_.accumulate
     property alias referential  : cloud_.referential
     property alias undistort    : cloud_.undistort
     property alias method       : cloud_.method
@@ -130,6 +132,7 @@ Actors {
         id: echoActor_
         objectName: component.objectName + "_echoActor"
         visible: component.visible
+        transform: cloud_.pointsTransform
         geometry: Geometry {
             id: geometry_
             primitiveType: cloud_.primitiveType
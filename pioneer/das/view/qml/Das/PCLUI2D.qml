@@ -18,6 +18,9 @@ ColumnLayout {
 
     property alias undistort            : undistort_.checked
     property alias undistortimage       : undistortimage_.checked
+    property alias rasterClouds         : rasterClouds_.checked
+    property alias displayResolution    : displayResolution_.checked
+    property alias segmentationImage    : segmentationImage_.checked
     property alias world                : world_.checked
     property alias worldCheckBoxVisible : world_.visible
     property alias pointSize            : pointSize_.value
@@ -26,6 +29,8 @@ ColumnLayout {
     property alias boxLabelsSize        : boxLabelsSize_.value
     property alias logScale             : logScale_.checked
     property alias amplitudeRatio       : amplRatio_.value
+    readonly property int pointsBudget  : Math.round(pointsBudget_.value) * 1000 // 0 for all points
+    readonly property int sweeps        : Math.round(sweeps_.value)
     property alias confThreshold        : confThreshold_.value
     property alias video                : video_.checked
     property alias categoryFilter       : categoryFilter_.text
@@ -205,6 +210,34 @@ ColumnLayout {
                     to: 100
                     Layout.preferredWidth: 150
                 }
+                Text {
+                    Layout.alignment: Qt.AlignRight
+                    text: "points budget (k): " + (pointsBudget_.value > 0 ? Math.round(pointsBudget_.value) : "all")
+                    font.pointSize: 8
+                }
+                Slider {
+                    id: pointsBudget_
+                    Layout.alignment: Qt.AlignRight
+                    value: 0
+                    from: 0
+                    to: 2000
+                    stepSize: 50
+                    Layout.preferredWidth: 150
+                }
+                Text {
+                    Layout.alignment: Qt.AlignRight
+                    text: "sweeps: " + Math.round(sweeps_.value)
+                    font.pointSize: 8
+                }
+                Slider {
+                    id: sweeps_
+                    Layout.alignment: Qt.AlignRight
+                    value: 1
+                    from: 1
+                    to: 50
+                    stepSize: 1
+                    Layout.preferredWidth: 150
+                }
             }
 
             RowLayout {
@@ -219,6 +252,24 @@ ColumnLayout {
                     text: "undistort image"
                     checked: false
                 }
+                SmallCheckBox {
+                    id: rasterClouds_
+                    Layout.alignment: Qt.AlignRight
+                    text: "rasterize clouds"
+                    checked: false
+                }
+                SmallCheckBox {
+                    id: displayResolution_
+                    Layout.alignment: Qt.AlignRight
+                    text: "display resolution"
+                    checked: false
+                }
+                SmallCheckBox {
+                    id: segmentationImage_
+                    Layout.alignment: Qt.AlignRight
+                    text: "segmentation image"
+                    checked: false
+                }
                 Text {
                     Layout.alignment: Qt.AlignRight
                     text: "Aspect ratio: "
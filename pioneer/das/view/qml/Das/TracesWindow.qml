@@ -31,6 +31,9 @@ DatasourceWindow {
     property alias zeroBaseline : zeroBaseline_.checked
     property alias cutoff : cutoff_.checked
     property alias smoothTrace : smoothTrace_.checked
+
+    property alias waterfall : waterfall_.checked
+    property alias waterfallFrames : waterfallFrames_.value
     ///////////////////////////////
     
     RowLayout {
@@ -138,6 +141,28 @@ DatasourceWindow {
             checked: true
         }
     }
+
+    RowLayout {
+        SmallCheckBox {
+            id: waterfall_
+            text: "Waterfall"
+            checked: false
+        }
+        Text {
+            visible: waterfall_.checked
+            text: "frames: "
+        }
+        SpinBox {
+            id: waterfallFrames_
+            visible: waterfall_.checked
+            value: 200
+            from: 10
+            to: 5000
+            stepSize: 50
+            editable: true
+            Layout.preferredHeight: 30
+        }
+    }
     
     FigureWithToolbar {
         Layout.fillWidth: true
@@ -198,6 +198,8 @@ DatasourceWindow {
                         undistort: controls_.undistort
                         pointSize: controls_.pointSize
                         amplitudeRatio: controls_.amplitudeRatio
+                        pointsBudget: controls_.pointsBudget
+                        accumulate: modelData.includes("-rgb") ? 1 : controls_.sweeps
                         logScale: controls_.logScale
                         useRGB: modelData.includes("-rgb") // This is dirty. The way the point clouds are colored should be refactored at some point.
 
@@ -0,0 +1,47 @@
+from pioneer.common import clouds
+from pioneer.das.view.caches import LRUCache
+
+import numpy as np
+
+'''
+Echo surface clouds (a quad made of 2 triangles per echo). The quad directions of a sensor are already cached by its
+specs, the triangle indices only depend on the number of echoes, so the per-frame work is a gather/scale of the
+distances.
+'''
+
+QUAD_INDICES_CACHE_SIZE = 16 # echo counts
+
+QUAD_INDICES = LRUCache(max_items = QUAD_INDICES_CACHE_SIZE)
+
+def quad_indices(n):
+    '''Cached clouds.generate_quads_indices(n).flatten(), the same array is returned for the same number of echoes'''
+    indices = QUAD_INDICES.get(n)
+    if indices is None:
+        indices = QUAD_INDICES.put(n, clouds.generate_quads_indices(n, np.uint32).flatten())
+    return indices
+
+def has_quad_directions(sensor):
+    '''True if the quad cloud of the sensor is made from its quad directions (see LCAx.get_corrected_cloud())'''
+    return hasattr(sensor, 'get_corrected_projection_data') and getattr(sensor, 'calibrated_angles', None) is None
+
+
+def quad_cloud(selection, distances, amplitudes, quad_directions, dtype = np.float64):
+    '''Same result as pioneer.common.clouds.to_quad_cloud(), from the quad directions of the sensor
+
+    Args:
+        selection - (N,) channel index of each echo
+        distances, amplitudes - (N,) arrays
+        quad_directions - (4*v*h, 3) directions of the 4 corners of each channel
+    Returns:
+        (points, amplitudes, indices), indices being the same array as long as N does not change
+    '''
+    n = selection.shape[0]
+
+    # four points per quad, 1 different direction per point, same distance for each
+    points = np.empty((4 * n, 3), dtype)
+    np.multiply(quad_directions.reshape(4, -1, 3)[:, selection], distances.reshape(1, n, 1), out = points.reshape(4, n, 3), casting = 'unsafe')
+
+    quad_amplitudes = np.empty((4 * n, 1), dtype)
+    quad_amplitudes.reshape(4, n)[:] = amplitudes
+
+    return points, quad_amplitudes, quad_indices(n)
@@ -0,0 +1,118 @@
+import numpy as np
+
+'''
+Vectorized rasterization of projected clouds into an RGBA overlay image, so that dense clouds can be displayed
+with a single matplotlib artist.
+'''
+
+MAX_CANDIDATE_PIXELS = 2**22 # bounds the memory used when rasterizing a chunk of triangles
+
+def disk_offsets(radius):
+    '''(dx, dy) pixel offsets covered by a disk of the given radius, in pixels'''
+    r = max(int(round(radius)), 0)
+    dy, dx = np.mgrid[-r:r+1, -r:r+1]
+    inside = dx**2 + dy**2 <= r**2 + r
+    return dx[inside], dy[inside]
+
+def _edge(ax, ay, bx, by, px, py):
+    return (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+
+
+class CloudRaster(object):
+    '''An RGBA image with a depth buffer, in which projected points and triangles are splatted.
+    Nearest primitives win, regardless of the order in which they are added.
+    '''
+    def __init__(self):
+        self.rgba = np.zeros((0, 0, 4), 'u1')
+        self.depth = np.zeros((0, 0), 'f4')
+
+    @property
+    def shape(self):
+        return self.rgba.shape[:2]
+
+    def reset(self, shape):
+        if self.shape != tuple(shape[:2]):
+            self.rgba = np.zeros(tuple(shape[:2]) + (4,), 'u1')
+            self.depth = np.full(shape[:2], np.inf, 'f4')
+        else:
+            self.rgba.fill(0)
+            self.depth.fill(np.inf)
+
+    def is_empty(self):
+        return not np.isfinite(self.depth).any()
+
+    def add_points(self, pts2d, depths, rgba, radius = 0):
+        '''
+        Args:
+            pts2d - (N,2) pixel coordinates
+            depths - (N,) distance to the camera
+            rgba - (N,4) colors in [0,1], or uint8
+            radius - in pixels, points are drawn as disks
+        '''
+        dx, dy = disk_offsets(radius)
+        x = (np.floor(pts2d[:,0]).astype('i8')[:,None] + dx[None,:]).ravel()
+        y = (np.floor(pts2d[:,1]).astype('i8')[:,None] + dy[None,:]).ravel()
+        primitive = np.repeat(np.arange(pts2d.shape[0]), dx.size)
+        self._write(x, y, primitive, depths, rgba)
+
+    def add_triangles(self, tri2d, depths, rgba):
+        '''
+        Args:
+            tri2d - (N,3,2) pixel coordinates of the vertices
+            depths - (N,) distance to the camera
+            rgba - (N,4) colors in [0,1], or uint8
+        '''
+        h, w = self.shape
+        lo = np.clip(np.floor(tri2d.min(axis=1)).astype('i8'), 0, [w-1, h-1])
+        hi = np.clip(np.floor(tri2d.max(axis=1)).astype('i8'), 0, [w-1, h-1])
+        sizes = hi - lo + 1
+        areas = sizes[:,0] * sizes[:,1]
+
+        # triangles covering no pixel center still get the pixel under their centroid
+        centroids = tri2d.mean(axis=1)
+        self._write(np.floor(centroids[:,0]).astype('i8'), np.floor(centroids[:,1]).astype('i8'), np.arange(tri2d.shape[0]), depths, rgba)
+
+        candidates = np.where(areas <= MAX_CANDIDATE_PIXELS)[0]
+        while candidates.size > 0:
+            n = max(np.searchsorted(np.cumsum(areas[candidates]), MAX_CANDIDATE_PIXELS, side='right'), 1)
+            self._fill_triangles(candidates[:n], tri2d, lo, sizes, areas, depths, rgba)
+            candidates = candidates[n:]
+
+    def _fill_triangles(self, triangles, tri2d, lo, sizes, areas, depths, rgba):
+        counts = areas[triangles]
+        primitive = np.repeat(triangles, counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        x = lo[primitive,0] + k % sizes[primitive,0]
+        y = lo[primitive,1] + k // sizes[primitive,0]
+
+        px, py = x + 0.5, y + 0.5
+        (ax, ay), (bx, by), (cx, cy) = [tri2d[primitive, i].T for i in range(3)]
+        e0 = _edge(ax, ay, bx, by, px, py)
+        e1 = _edge(bx, by, cx, cy, px, py)
+        e2 = _edge(cx, cy, ax, ay, px, py)
+        inside = ((e0 >= 0) & (e1 >= 0) & (e2 >= 0)) | ((e0 <= 0) & (e1 <= 0) & (e2 <= 0))
+
+        self._write(x[inside], y[inside], primitive[inside], depths, rgba)
+
+    def _write(self, x, y, primitive, depths, rgba):
+        h, w = self.shape
+        valid = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+        pixels = y[valid] * w + x[valid]
+        primitive = primitive[valid]
+        z = depths[primitive]
+
+        # keep the nearest primitive per pixel, then test it against the depth buffer.
+        # Bits of non-negative float32 sort like the floats, so a single integer sort orders by (pixel, depth)
+        keys = (pixels.astype('u8') << np.uint64(32)) | np.maximum(z, 0).astype('f4').view('u4').astype('u8')
+        order = np.argsort(keys)
+        pixels, primitive, z = pixels[order], primitive[order], z[order]
+        first = np.ones(pixels.size, bool)
+        first[1:] = pixels[1:] != pixels[:-1]
+        pixels, primitive, z = pixels[first], primitive[first], z[first]
+
+        depth = self.depth.reshape(-1)
+        nearer = z < depth[pixels]
+        pixels, primitive = pixels[nearer], primitive[nearer]
+        depth[pixels] = z[nearer]
+        colors = rgba[primitive]
+        self.rgba.reshape(-1, 4)[pixels] = colors if colors.dtype == np.uint8 else np.clip(colors * 255, 0, 255).astype('u1')
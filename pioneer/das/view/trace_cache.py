@@ -0,0 +1,261 @@
+from pioneer.common import platform as platform_utils
+from pioneer.common.logging_manager import LoggingManager
+from pioneer.common.trace_processing import TraceProcessingCollection, Binning, Clip, CutInterval, Decimate, Desaturate, Realign\
+    , RemoveStaticNoise, Smooth, ZeroBaseline
+from pioneer.das.api import platform
+from pioneer.das.view.caches import LRUCache
+
+from concurrent.futures import ProcessPoolExecutor
+
+import copy
+import hashlib
+import multiprocessing
+import numpy as np
+import os
+import sys
+
+'''
+Processed traces of a few channels at a time, memoized per (frame, channel, processing chain). Trace processing steps
+work channel by channel, except for a few frame-wide values (the saturation level, the latest time base delay), which
+are preserved by also processing the channels holding them.
+
+Optionally, processed traces of a whole recording are also stored in memory-mapped files next to the dataset, filled
+by a background process pool, so that scrubbing through processed traces becomes a slice read.
+'''
+
+PROCESSED_TRACES_BYTES = 64 * 2**20
+FULL_FRAMES_CACHE_SIZE = 2
+PERSIST_PROCESSED_TRACES = False # if True (dasview --persist_traces), processed traces are stored in PROCESSED_TRACES_DIRECTORY, next to the dataset
+PROCESSED_TRACES_DIRECTORY = 'processed_traces'
+FILL_WORKERS = 4
+FILL_CHUNK_FRAMES = 16
+FILL_WINDOW_FRAMES = 256 # frames queued around the cursor at once, so that pending work stays bounded
+
+PROCESSED_TRACES = LRUCache(max_bytes = PROCESSED_TRACES_BYTES) # (frame, channel) -> processed trace
+FULL_FRAMES = LRUCache(max_items = FULL_FRAMES_CACHE_SIZE) # frame -> sample.processed()
+
+# on exit, concurrent.futures waits for every queued work item, unless they are cancelled (cancel_futures is 3.9+)
+_SHUTDOWN_KWARGS = {'cancel_futures': True} if sys.version_info >= (3, 9) else {}
+
+_PER_CHANNEL_STEPS = (Binning, Clip, CutInterval, Decimate, Desaturate, Realign, Smooth, ZeroBaseline)
+_PER_CHANNEL_FIELDS = ['data', 'time_base_delays']
+
+def _param_key(value):
+    if value is None or np.isscalar(value):
+        return value
+    # arrays (e.g. static noise) and other objects are keyed by content: equal parameters of a rebuilt collection hit
+    # the cache, and a freed object whose id() is reused cannot return stale traces
+    digest = hashlib.sha1()
+    _digest_update(digest, value)
+    return digest.hexdigest()
+
+def processing_key(trace_processing):
+    '''Hashable identity of a TraceProcessingCollection: the type and parameters of its steps, in their apply order'''
+    steps = [trace_processing.list_trace_processing[i] for i in trace_processing.apply_order]
+    return tuple((type(step).__name__, tuple(sorted((k, _param_key(v)) for k, v in vars(step).items()))) for step in steps)
+
+def _digest_update(digest, value):
+    if isinstance(value, np.ndarray):
+        digest.update(str((value.dtype, value.shape)).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__}{len(value)}'.encode())
+        for v in value:
+            _digest_update(digest, v)
+    elif isinstance(value, dict):
+        for k, v in sorted(value.items(), key = lambda item: repr(item[0])):
+            digest.update(repr(k).encode())
+            _digest_update(digest, v)
+    elif hasattr(value, '__dict__'):
+        digest.update(type(value).__name__.encode())
+        for k, v in sorted(vars(value).items()):
+            digest.update(k.encode())
+            _digest_update(digest, v)
+    else:
+        digest.update(repr(value).encode())
+
+def processing_digest(trace_processing):
+    '''Hash of the steps of a TraceProcessingCollection and of their parameters' content, stable across sessions'''
+    digest = hashlib.sha1()
+    for i in trace_processing.apply_order:
+        _digest_update(digest, trace_processing.list_trace_processing[i])
+    return digest.hexdigest()
+
+def _frame_traces(sample, fast_trace_type):
+    return sample.raw if fast_trace_type is None else sample.raw[fast_trace_type]
+
+def processed_frame(sample, trace_processing, fast_trace_type = None, key = None):
+    '''Cached sample.processed(trace_processing) (or its fast_trace_type part), for when all channels are needed'''
+    frame = (sample.datasource.label, sample.index, processing_key(trace_processing) if key is None else key)
+    processed = FULL_FRAMES.get(frame)
+    if processed is None:
+        processed = FULL_FRAMES.put(frame, sample.processed(trace_processing))
+    return processed if fast_trace_type is None else processed[fast_trace_type]
+
+def processed_traces(sample, trace_processing, channels, fast_trace_type = None, key = None):
+    '''Same traces as sample.processed(trace_processing)['data'][channels] (or [fast_trace_type]['data'][channels]),
+    only the channels not processed yet are.
+
+    Args:
+        channels - channel indices
+        fast_trace_type - 'high' or 'low' for FastTrace samples
+        key - processing_key(trace_processing), if already known
+    Returns:
+        a list with the processed trace of each channel
+    '''
+    key = processing_key(trace_processing) if key is None else key
+    frame = (sample.datasource.label, sample.index, fast_trace_type, key)
+    traces = {c: PROCESSED_TRACES.get((frame, c)) for c in map(int, channels)}
+    missing = [c for c, trace in traces.items() if trace is None]
+    if missing:
+        for c, trace in zip(missing, _process_channels(sample, trace_processing, missing, fast_trace_type, key)):
+            traces[c] = PROCESSED_TRACES.put((frame, c), trace)
+    return [traces[int(c)] for c in channels]
+
+def _process_channels(sample, trace_processing, channels, fast_trace_type, key):
+    traces = _frame_traces(sample, fast_trace_type)
+    n = traces['data'].shape[0]
+    steps = [trace_processing.list_trace_processing[i] for i in trace_processing.apply_order]
+    if not all(isinstance(step, _PER_CHANNEL_STEPS + (RemoveStaticNoise,)) for step in steps):
+        data = processed_frame(sample, trace_processing, fast_trace_type, key)['data']
+        return [np.array(data[c]) for c in channels]
+
+    rows = list(channels)
+    if any(isinstance(step, Desaturate) for step in steps):
+        # the saturation level is the maximum of the whole frame
+        rows.append(int(np.argmax(traces['data'])) // traces['data'].shape[-1])
+    if any(isinstance(step, Realign) for step in steps) and isinstance(traces['time_base_delays'], np.ndarray):
+        # traces are aligned on the latest time base delay of the frame
+        rows.append(int(np.argmax(traces['time_base_delays'])))
+
+    scoped_steps = []
+    for step in steps:
+        noise = getattr(step, 'static_noise', None)
+        if isinstance(step, RemoveStaticNoise) and isinstance(noise, np.ndarray) and noise.ndim == 2 and noise.shape[0] == n:
+            step = copy.copy(step)
+            step.static_noise = noise[rows]
+        scoped_steps.append(step)
+
+    scoped = {k: v[rows] if k in _PER_CHANNEL_FIELDS and isinstance(v, np.ndarray) and v.ndim > 0 and v.shape[0] == n
+                     else copy.deepcopy(v)
+              for k, v in traces.items()}
+    data = TraceProcessingCollection(scoped_steps)(scoped)['data']
+    return [np.array(data[i]) for i in range(len(channels))]
+
+def store_directory(platform):
+    if not PERSIST_PROCESSED_TRACES or getattr(platform, 'dataset', None) is None:
+        return None
+    return os.path.join(platform.dataset, PROCESSED_TRACES_DIRECTORY)
+
+
+class ProcessedTraceStore(object):
+    '''Processed traces of every frame of a trace datasource, for one processing chain (and fast trace type), in a
+    memory-mapped (frames, channels, length) float32 file. A background process pool fills it, a 'done' map tells which
+    frames can be read. Files are named by datasource and processing_digest(), so they are reused by later sessions.
+    '''
+    def __init__(self, platform, ds_name, trace_processing, fast_trace_type = None, directory = None, n_workers = FILL_WORKERS):
+        self.platform = platform
+        self.ds_name = ds_name
+        self.trace_processing = trace_processing
+        self.fast_trace_type = fast_trace_type
+        self.n_workers = n_workers
+        name = f'{ds_name}_{fast_trace_type}' if fast_trace_type is not None else ds_name
+        name = f'{name}_{processing_digest(trace_processing)}'
+        directory = store_directory(platform) if directory is None else directory
+        self.path = os.path.join(directory, name + '.npy')
+        self.done_path = os.path.join(directory, name + '_done.npy')
+        self.traces = None
+        self.done = None
+        self.executor = None
+        self.futures = {} # frames of a chunk -> future
+        self.window = None # frames queued by the last fill_around()
+
+    def open(self, sample):
+        '''Opens the files, or creates them with the shape of the processed traces of sample. Returns False on failure.'''
+        if self.traces is not None:
+            return True
+        n_frames = len(self.platform[self.ds_name])
+        try:
+            if os.path.exists(self.path) and os.path.exists(self.done_path):
+                traces, done = np.load(self.path, mmap_mode = 'r'), np.load(self.done_path, mmap_mode = 'r')
+                if traces.shape[0] == n_frames and done.shape[0] == n_frames:
+                    self.traces, self.done = traces, done
+                    return True
+            shape = processed_frame(sample, self.trace_processing, self.fast_trace_type)['data'].shape
+            os.makedirs(os.path.dirname(self.path), exist_ok = True)
+            np.lib.format.open_memmap(self.path, 'w+', np.float32, (n_frames,) + shape).flush()
+            np.lib.format.open_memmap(self.done_path, 'w+', np.uint8, (n_frames,)).flush()
+            self.traces, self.done = np.load(self.path, mmap_mode = 'r'), np.load(self.done_path, mmap_mode = 'r')
+            return True
+        except Exception as e:
+            LoggingManager.instance().warning(f'Could not open processed traces {self.path}: {e}')
+            return False
+
+    def get(self, index, channels):
+        '''Processed traces of some channels of a frame, None if the frame is not stored yet'''
+        if self.done is None or not self.done[index]:
+            return None
+        return self.traces[index, channels]
+
+    def fill(self, indices):
+        '''Processes the given frames in the background, in this order (e.g. the current slice, from the cursor).
+        Frames queued by a previous call and not started yet are dropped.'''
+        if self.done is None:
+            return
+        self.cancel()
+        running = {i for chunk in self.futures for i in chunk}
+        indices = [int(i) for i in indices if not self.done[i] and int(i) not in running]
+        if not indices:
+            return
+        if self.executor is None:
+            sensor_type, position, _ = platform_utils.parse_datasource_name(self.ds_name)
+            self.executor = ProcessPoolExecutor(max_workers = self.n_workers, mp_context = multiprocessing.get_context('spawn')
+                                              , initializer = _init_worker
+                                              , initargs = (self.platform.dataset, self.platform.configuration, [f'{sensor_type}_{position}']))
+        for start in range(0, len(indices), FILL_CHUNK_FRAMES):
+            chunk = tuple(indices[start:start + FILL_CHUNK_FRAMES])
+            self.futures[chunk] = self.executor.submit(_fill_frames, self.ds_name, self.trace_processing, self.fast_trace_type
+                                                     , self.path, self.done_path, chunk)
+
+    def fill_around(self, cursor, n_frames = FILL_WINDOW_FRAMES):
+        '''Processes the frames of a window around the cursor, nearest first. The window is only queued again once the
+        cursor moved by more than a quarter of it.'''
+        if self.done is None:
+            return
+        start = max(0, min(cursor - n_frames//2, self.done.shape[0] - n_frames))
+        if self.window is not None and self.executor is not None and abs(start - self.window.start) <= n_frames//4:
+            return
+        self.window = range(start, min(start + n_frames, self.done.shape[0]))
+        self.fill(sorted(self.window, key = lambda i: (abs(i - cursor), i < cursor)))
+
+    def cancel(self):
+        '''Drops the queued chunks, the running ones are kept'''
+        self.futures = {chunk: future for chunk, future in self.futures.items() if not future.cancel() and not future.done()}
+
+    def shutdown(self):
+        '''Drops the queued chunks and stops the workers, without waiting for them. fill() starts new ones.'''
+        self.cancel()
+        self.futures = {}
+        self.window = None
+        if self.executor is not None:
+            self.executor.shutdown(wait = False, **_SHUTDOWN_KWARGS)
+            self.executor = None
+
+
+_WORKER_PLATFORM = None
+
+def _init_worker(dataset, configuration, include):
+    global _WORKER_PLATFORM
+    _WORKER_PLATFORM = platform.Platform(dataset, configuration, include = include, progress_bar = False, default_cache_size = 1)
+
+def _fill_frames(ds_name, trace_processing, fast_trace_type, path, done_path, indices):
+    traces, done = np.load(path, mmap_mode = 'r+'), np.load(done_path, mmap_mode = 'r+')
+    datasource = _WORKER_PLATFORM[ds_name]
+    for i in indices:
+        if done[i]:
+            continue
+        processed = datasource[i].processed(trace_processing)
+        traces[i] = (processed if fast_trace_type is None else processed[fast_trace_type])['data']
+        done[i] = 1
+    traces.flush()
+    done.flush()
@@ -0,0 +1,156 @@
+from pioneer.common.logging_manager import LoggingManager
+from pioneer.das.api.samples.image import Image
+from pioneer.das.view.caches import LRUCache
+
+import cv2
+import hashlib
+import numpy as np
+import os
+
+'''
+Process-wide cache of undistortion remap tables, shared by every window displaying a given camera.
+'''
+
+MAPS_CACHE_SIZE = 16 # (intrinsics, roi) pairs
+PERSIST_MAPS = False # if True (dasview --persist_undistort_maps), maps are also saved next to the dataset, in MAPS_DIRECTORY
+MAPS_DIRECTORY = 'undistort_maps'
+
+MAPS_CACHE = LRUCache(max_items = MAPS_CACHE_SIZE)
+NEW_CAMERA_MATRICES = LRUCache(max_items = MAPS_CACHE_SIZE)
+
+def _intrinsics_key(*arrays):
+    return tuple(np.ascontiguousarray(a, dtype='f8').tobytes() for a in arrays)
+
+def und_camera_matrix(camera_matrix, distortion_coeffs, size, alpha = 0.0):
+    '''Cached cv2.getOptimalNewCameraMatrix(), same default as pioneer.das.api.samples.Image.und_camera_matrix
+
+    Args:
+        size - (width, height) of the image
+    '''
+    key = _intrinsics_key(camera_matrix, distortion_coeffs) + (tuple(size), alpha)
+    matrix = NEW_CAMERA_MATRICES.get(key)
+    if matrix is None:
+        matrix, _ = cv2.getOptimalNewCameraMatrix(camera_matrix, distortion_coeffs, tuple(size), alpha, tuple(size))
+        NEW_CAMERA_MATRICES.put(key, matrix)
+    return matrix
+
+def undistort_maps(camera_matrix, distortion_coeffs, new_camera_matrix, size, roi = None, directory = None):
+    '''Fixed-point (CV_16SC2) remap tables, equivalent to what cv2.undistort() computes on every call.
+
+    Args:
+        size - (width, height) of the image
+        roi - optional (x0, y0, x1, y1), only this region of the undistorted image is mapped
+        directory - optional, where the full resolution maps are persisted
+    Returns:
+        (map1, map2), to be used with cv2.remap()
+    '''
+    key = _intrinsics_key(camera_matrix, distortion_coeffs, new_camera_matrix) + (tuple(size),)
+    maps = MAPS_CACHE.get(key + (roi,))
+    if maps is not None:
+        return maps
+
+    maps = MAPS_CACHE.get(key)
+    if maps is None:
+        maps = _load_maps(directory, key)
+        if maps is None:
+            maps = cv2.initUndistortRectifyMap(camera_matrix, distortion_coeffs, None, new_camera_matrix, tuple(size), cv2.CV_16SC2)
+            _save_maps(directory, key, maps)
+        MAPS_CACHE.put(key, maps)
+
+    if roi is not None:
+        x0, y0, x1, y1 = roi
+        maps = tuple(np.ascontiguousarray(m[y0:y1, x0:x1]) for m in maps)
+        MAPS_CACHE.put(key + (roi,), maps)
+    return maps
+
+def undistort_image(image, camera_matrix, distortion_coeffs, new_camera_matrix = None, roi = None, directory = None):
+    '''Same result as cv2.undistort(), with cached maps. If roi (x0, y0, x1, y1) is given, only that region is returned.'''
+    size = (image.shape[1], image.shape[0])
+    if new_camera_matrix is None:
+        new_camera_matrix = und_camera_matrix(camera_matrix, distortion_coeffs, size)
+    map1, map2 = undistort_maps(camera_matrix, distortion_coeffs, new_camera_matrix, size, roi, directory)
+    return cv2.remap(image, map1, map2, cv2.INTER_LINEAR)
+
+def scaled_size(size, scale):
+    '''(width, height) of an image of the given (width, height), decoded at the given scale'''
+    return (max(int(round(size[0]*scale)), 1), max(int(round(size[1]*scale)), 1))
+
+def scale_camera_matrix(camera_matrix, size, new_size):
+    '''Intrinsics of an image resized from size to new_size, both (width, height). Pixel centers are preserved.'''
+    sx, sy = new_size[0]/size[0], new_size[1]/size[1]
+    scale = np.array([[sx, 0, (sx - 1)/2]
+                    , [0, sy, (sy - 1)/2]
+                    , [0,  0,          1]])
+    return scale @ camera_matrix
+
+def has_pinhole_model(sample):
+    '''True if sample.get_image(undistort=True) is the cv2 pinhole undistortion these maps reproduce. Subclasses
+    (e.g. ImageFisheye, ImageCylinder) have their own undistortion model, or are always undistorted.'''
+    return type(sample) is Image
+
+def get_image(sample, undistort = False, roi = None, directory = None, scale = 1):
+    '''sample.get_image(undistort), with cached undistortion maps for pinhole cameras.
+
+    Args:
+        roi - optional (x0, y0, x1, y1) in the coordinates of the decoded image, the image is cropped to it
+        scale - the image is downsampled (area interpolation) by this factor, before being undistorted (after, for
+            cameras without a pinhole model)
+    '''
+    return decode_image(sample, undistort, roi, directory, scale)[0]
+
+def decode_image(sample, undistort = False, roi = None, directory = None, scale = 1):
+    '''Same as get_image(), also returns the shape of the full resolution image, from the single decode
+
+    Returns:
+        (image, shape)
+    '''
+    pinhole = has_pinhole_model(sample)
+    image = sample.get_image(undistort = undistort and not pinhole)
+    shape = image.shape
+    size = (shape[1], shape[0])
+    if scale != 1:
+        image = cv2.resize(image, scaled_size(size, scale), interpolation = cv2.INTER_AREA)
+
+    if undistort and pinhole:
+        camera_matrix = sample.camera_matrix
+        new_camera_matrix = und_camera_matrix(camera_matrix, sample.distortion_coeffs, size)
+        if scale != 1:
+            new_size = (image.shape[1], image.shape[0])
+            camera_matrix = scale_camera_matrix(camera_matrix, size, new_size)
+            new_camera_matrix = scale_camera_matrix(new_camera_matrix, size, new_size)
+        return undistort_image(image, camera_matrix, sample.distortion_coeffs, new_camera_matrix, roi, directory), shape
+    if roi is not None:
+        x0, y0, x1, y1 = roi
+        return image[y0:y1, x0:x1], shape
+    return image, shape
+
+def maps_directory(platform):
+    if not PERSIST_MAPS or getattr(platform, 'dataset', None) is None:
+        return None
+    return os.path.join(platform.dataset, MAPS_DIRECTORY)
+
+def _maps_path(directory, key):
+    return os.path.join(directory, hashlib.sha1(b''.join(key[:-1]) + str(key[-1]).encode()).hexdigest() + '.npz')
+
+def _load_maps(directory, key):
+    if directory is None:
+        return None
+    path = _maps_path(directory, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as f:
+            return f['map1'], f['map2']
+    except Exception as e:
+        LoggingManager.instance().warning(f'Could not load undistortion maps from {path}: {e}')
+        return None
+
+def _save_maps(directory, key, maps):
+    if directory is None:
+        return
+    path = _maps_path(directory, key)
+    try:
+        os.makedirs(directory, exist_ok = True)
+        np.savez(path, map1 = maps[0], map2 = maps[1])
+    except Exception as e:
+        LoggingManager.instance().warning(f'Could not save undistortion maps to {path}: {e}')
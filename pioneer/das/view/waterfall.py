@@ -0,0 +1,69 @@
+from pioneer.common.logging_manager import LoggingManager
+
+import numpy as np
+import threading
+
+'''
+Waterfall (frames x range) image of one channel's trace, streamed over a range of frames on a background thread.
+'''
+
+WATERFALL_CHUNK_FRAMES = 16 # frames read between two refreshes
+WATERFALL_REFRESH_MS = 100
+
+def uncached_sample(datasource, index):
+    '''A sample of a DatasourceWrapper that bypasses its sample cache (which is not thread-safe), so that a stream reads
+    the FileSource directly and does not evict the samples used by the windows. It is dropped once its channel is read.'''
+    return datasource.sample_factory(index, datasource)
+
+class WaterfallStream(object):
+    '''Reads the trace of a frame range into a (frames, length) float32 image, by chunks, on a daemon thread.
+
+    Rows are NaN until read, 'filled' tells how many leading rows are ready. The stream stops at the next frame once
+    cancelled, e.g. when the cursor or the selection changes.
+    '''
+    def __init__(self, read_trace, indices, known = None, chunk_frames = WATERFALL_CHUNK_FRAMES):
+        '''
+        Args:
+            read_trace - f(frame index) -> (length,) trace of the channel, called from the stream's thread
+            indices - frame indices, one per row
+            known - frame index -> trace already read (e.g. by a previous stream), reused instead of being read again
+        '''
+        self.read_trace = read_trace
+        self.indices = list(indices)
+        self.known = {} if known is None else known
+        self.chunk_frames = chunk_frames
+        self.image = None
+        self.filled = 0
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target = self._run, daemon = True)
+        self.thread.start()
+
+    @property
+    def done(self):
+        return self.filled == len(self.indices) or self.cancelled.is_set()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def rows(self):
+        '''frame index -> trace, of the rows read so far'''
+        image = self.image
+        return {} if image is None else {i: image[k] for k, i in enumerate(self.indices[:self.filled])}
+
+    def _run(self):
+        n = len(self.indices)
+        try:
+            for start in range(0, n, self.chunk_frames):
+                for k in range(start, min(start + self.chunk_frames, n)):
+                    if self.cancelled.is_set():
+                        return
+                    i = self.indices[k]
+                    trace = self.known[i] if i in self.known else self.read_trace(i)
+                    if self.image is None:
+                        self.image = np.full((n, trace.shape[-1]), np.nan, np.float32)
+                    m = min(trace.shape[-1], self.image.shape[1])
+                    self.image[k, :m] = trace[:m]
+                self.filled = min(start + self.chunk_frames, n)
+        except Exception as e:
+            LoggingManager.instance().warning(f'Waterfall stream stopped: {e}')
+            self.cancel()
@@ -0,0 +1,154 @@
+from pioneer.common.gui import CustomActors, utils
+from pioneer.das.view.caches import LRUCache
+from pioneer.das.view.geometry import euler_to_matrices
+
+from PyQt5.QtCore import QPointF
+from PyQt5.QtGui import QColor, QFont, QPainterPath
+
+import numpy as np
+
+'''
+Pools of 3D box and label actors, so that drawing a new frame of annotations only updates the matrices, colors and
+label meshes of existing actors instead of rebuilding (and re-uploading) an actor per box.
+'''
+
+TEXT_MESHES_CACHE_SIZE = 1024 # (label, font size) pairs
+MAX_SPARE_ACTORS = 32 # hidden actors kept in each pool for later frames
+
+TEXT_MESHES = LRUCache(max_items = TEXT_MESHES_CACHE_SIZE)
+
+def text_mesh(text, font_size, font = "Arial", scale = 0.1):
+    '''Cached LINE_LOOP mesh of a label, same geometry as pioneer.common.gui.CustomActors.text(origin=[0,0,0], v=[0,-1,0])
+
+    Returns:
+        (indices, vertices), with the same dtypes as CustomActors.text()
+    '''
+    key = (text, font_size, font, scale)
+    mesh = TEXT_MESHES.get(key)
+    if mesh is not None:
+        return mesh
+
+    path = QPainterPath()
+    path.addText(QPointF(0, 0), QFont(font, font_size), text)
+    polygons = [np.array([[p.x(), p.y()] for p in polygon], 'f8').reshape(-1, 2) for polygon in path.toSubpathPolygons()]
+
+    vertices = np.zeros((sum(p.shape[0] for p in polygons), 3), 'f4')
+    if polygons:
+        points = np.vstack(polygons) * scale
+        vertices[:,0] = points[:,0]
+        vertices[:,1] = -points[:,1]
+
+    indices, start = [], 0
+    for polygon in polygons:
+        indices.append(np.arange(start, start + polygon.shape[0]))
+        indices.append([-1])
+        start += polygon.shape[0]
+    indices = np.concatenate(indices).astype('u4') if indices else np.zeros(0, 'u4')
+
+    return TEXT_MESHES.put(key, (indices, vertices))
+
+def box_matrices(c_xyz, d_xyz, r_xyz):
+    '''(N,4,4) matrices mapping a unit box centered on the origin to each box'''
+    c_xyz = np.asarray(c_xyz, dtype = 'f8').reshape(-1, 3)
+    d_xyz = np.asarray(d_xyz, dtype = 'f8').reshape(-1, 3)
+    matrices = np.zeros((c_xyz.shape[0], 4, 4), 'f8')
+    matrices[:,:3,:3] = euler_to_matrices(r_xyz) * d_xyz[:,None,:]
+    matrices[:,:3,3] = c_xyz
+    matrices[:,3,3] = 1
+    return matrices
+
+
+class _ActorPool(object):
+    '''Actors owned by an Actors container. Actors in use are visible, spare ones are hidden until needed.'''
+
+    def __init__(self, container):
+        self.container = container
+        self.actors = []
+        self.n_used = 0
+
+    def acquire(self, n):
+        '''Returns n actors, creating new ones only if the pool is too small'''
+        while len(self.actors) < n:
+            self.actors.append(self.container.addActor(self._create()))
+
+        for actor in self.actors[:n]:
+            actor.visible = True
+        for actor in self.actors[n:self.n_used]:
+            actor.visible = False
+
+        for actor in self.actors[n + MAX_SPARE_ACTORS:]:
+            self.container.removeActor(actor)
+        del self.actors[n + MAX_SPARE_ACTORS:]
+
+        self.n_used = n
+        return self.actors[:n]
+
+    def _create(self):
+        raise NotImplementedError()
+
+    @staticmethod
+    def _set_color(actor, color):
+        uniforms = actor.effect.shader0.uniforms
+        if uniforms['color'] != color:
+            actor.effect.shader0.uniforms = {**uniforms, 'color': color}
+
+
+class BoxActorPool(_ActorPool):
+    '''Unit box actors, each one placed by its transform matrix'''
+
+    def __init__(self, container, line_width = 2):
+        super(BoxActorPool, self).__init__(container)
+        self.line_width = line_width
+
+    def _create(self):
+        actor = CustomActors.bbox([0,0,0], [1,1,1], [0,0,0], color = QColor('white'), name = 'pooled_bbox')
+        actor.effect.lineWidth = self.line_width
+        return actor
+
+    def update(self, c_xyz, d_xyz, r_xyz, colors):
+        '''
+        Args:
+            c_xyz, d_xyz, r_xyz: (N,3) centers, dimensions and rotations of the boxes
+            colors: N QColors
+        Returns:
+            (N,3) text anchors, the same as returned by CustomActors.bbox(return_anchor=True)
+        '''
+        matrices = box_matrices(c_xyz, d_xyz, r_xyz)
+        for actor, matrix, color in zip(self.acquire(len(colors)), matrices, colors):
+            actor.transform.matrix = utils.from_numpy(matrix.astype('f4'))
+            self._set_color(actor, color)
+
+        # front point of the unit box, see CustomActors.bbox()
+        return matrices[:,:3,:3] @ np.array([0.5, 0, 0.5]) + matrices[:,:3,3]
+
+
+class TextActorPool(_ActorPool):
+    '''Billboard label actors, whose meshes are swapped from the text meshes cache when their string changes'''
+
+    def __init__(self, container, line_width = 3):
+        super(TextActorPool, self).__init__(container)
+        self.line_width = line_width
+
+    def _create(self):
+        actor = CustomActors.text('', color = QColor('white'), origin = [0,0,0], v = [0,-1,0], line_width = self.line_width
+                                  , is_billboard = True, name = 'pooled')
+        actor.label = None
+        return actor
+
+    def update(self, labels, anchors, colors, font_size):
+        '''
+        Args:
+            labels: N strings
+            anchors: (N,3) positions of the labels
+            colors: N QColors
+        '''
+        for actor, label, anchor, color in zip(self.acquire(len(labels)), labels, anchors, colors):
+            if actor.label != (label, font_size):
+                actor.label = (label, font_size)
+                indices, vertices = text_mesh(label, font_size)
+                actor.geometry.indices.set_ndarray(indices)
+                actor.geometry.attribs.vertices.set_ndarray(vertices)
+            matrix = np.eye(4, dtype = 'f4')
+            matrix[:3,3] = anchor
+            actor.transform.matrix = utils.from_numpy(matrix)
+            self._set_color(actor, color)
@@ -0,0 +1,64 @@
+DEFAULT_BLITTING = True
+
+class BlitManager(object):
+    '''Blitting render path for the QtQuick matplotlib backend.
+
+    Dynamic artists are flagged as animated, so a regular draw only rasterizes the static parts of the figure
+    (axes, spines, ticks, legends, titles), which are cached. Subsequent draws restore the cached background and only
+    draw the dynamic artists over it. The cache is invalidated on resize, or when the layout of an axis changes.
+    '''
+    def __init__(self, backend, enabled = DEFAULT_BLITTING):
+        self.backend = backend
+        self.figure = backend.getFigure()
+        self.enabled = enabled
+        self.background = None
+        self.layout = None
+        self.artists = []
+        if self.enabled:
+            self.backend.mpl_connect('draw_event', self._on_draw)
+            self.backend.mpl_connect('resize_event', self._on_resize)
+
+    def invalidate(self):
+        self.background = None
+
+    def draw(self, artists):
+        ''' artists: the artists that changed since last draw, all others are considered static
+        '''
+        if not self.enabled:
+            return self.backend.draw()
+
+        artists = [a for a in artists if a is not None]
+        for artist in artists:
+            artist.set_animated(True)
+        self.artists = sorted([a for a in artists if a.figure is not None], key = lambda a: a.get_zorder())
+
+        layout = self._layout()
+        if self.background is None or layout != self.layout:
+            self.layout = layout
+            return self.backend.draw() # will call _on_draw()
+
+        self.backend.restore_region(self.background)
+        self._draw_artists()
+        self.backend.update()
+
+    def _on_draw(self, event):
+        self.background = self.backend.copy_from_bbox(self.figure.bbox)
+        self._draw_artists()
+
+    def _on_resize(self, event):
+        self.invalidate()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            if artist.figure is not None:
+                self.figure.draw_artist(artist)
+
+    def _layout(self):
+        layout = [tuple(self.figure.bbox.bounds)]
+        for ax in self.figure.axes:
+            legend = ax.get_legend()
+            layout.append(( tuple(ax.bbox.bounds)
+                          , tuple(ax.viewLim.bounds)
+                          , ax.get_title()
+                          , None if legend is None else tuple(t.get_text() for t in legend.get_texts())))
+        return layout
@@ -1,27 +1,39 @@
-from pioneer.common import linalg
-from pioneer.common.platform import parse_datasource_name
+from pioneer.common.platform import parse_datasource_name, extract_sensor_id
 from pioneer.common.gui import utils
 from pioneer.common.video import VideoRecorder, RecordableInterface
-from pioneer.das.api import categories, lane_types
+from pioneer.das.api import categories
 from pioneer.das.api.samples import Echo
 from pioneer.das.api.samples.annotations.box_2d import Box2d
 from pioneer.das.api.samples.annotations.box_3d import Box3d
 from pioneer.das.api.samples.image import Image
 from pioneer.das.api.samples.point_cloud import PointCloud
 from pioneer.das.api.sensors import Sensor
+from pioneer.das.view.caches import LRUCache
+from pioneer.das.view.cloud_store import COMPACT_CLOUDS
+from pioneer.das.view.geometry import BOX_FACES, bboxes_to_8coordinates
+from pioneer.das.view.point_colors import rgb_field_colors, seg3d_colors
+from pioneer.das.view.prefetch import ImagePrefetcher
+from pioneer.das.view.projection import project_pts, projection_mask
+from pioneer.das.view.rasterize import CloudRaster
+from pioneer.das.view.undistort import maps_directory, scaled_size
 from pioneer.das.view.windows import Window
+from pioneer.das.view.windows.blitting import BlitManager
+from pioneer.das.view.windows.overlays import ImageOverlay, LinesOverlay, PolygonsOverlay, LANE_STYLES, box_labels, confidences_array, \
+                                             filter_boxes, poly2d_labels, seg2d_labels, segmentation_image
 
-from matplotlib.patches import Rectangle, Polygon
 from matplotlib.collections import PolyCollection
-from PyQt5.QtCore import QObject
+from PyQt5.QtCore import QObject, QTimer
 from PyQt5.QtGui import QColor
 from PyQt5.QtQml import QQmlProperty
 
 import matplotlib
-import matplotlib.patheffects as PathEffects
 import matplotlib.pyplot as plt
 import numpy as np
 
+PROJECTION_CACHE_SIZE = 32 # (cloud datasource, camera frame) pairs
+DISPLAY_SCALES = [1/8, 1/4, 1/2, 1] # decoding resolutions available in display resolution mode
+SEGMENTATION_CACHE_BYTES = 128 * 2**20
+POLYGONS_CACHE_SIZE = 64 # (segmentation datasource, frame, threshold)
 
 
 class ImagerWindow(Window, RecordableInterface):
@@ -32,8 +44,20 @@ class ImagerWindow(Window, RecordableInterface):
         self.datasource = datasource
         self.backend = self.window.findChild(QObject, "figure")
         self.ax = self.backend.getFigure().add_subplot(111)
+        self.blit_manager = BlitManager(self.backend)
         self.image = None
+        self.image_shape = None
+        self.scale = 1
+        self.roi = None
         self.scatter = None
+        self.cloud_overlay = None
+        self.cloud_raster = CloudRaster()
+        self.overlays = {}
+        self.prefetcher = ImagePrefetcher(platform, datasource, maps_directory = maps_directory(platform))
+        self.projection_cache = LRUCache(max_items = PROJECTION_CACHE_SIZE)
+        self.segmentation_cache = LRUCache(max_bytes = SEGMENTATION_CACHE_BYTES)
+        self.polygons_cache = LRUCache(max_items = POLYGONS_CACHE_SIZE)
+        self.extrinsics_version = 0
         self.video_recorder = VideoRecorder.create(self, datasource, platform, synchronized, video_fps)
 
     def get_frame(self):
@@ -41,6 +65,10 @@ class ImagerWindow(Window, RecordableInterface):
         width, height = self.backend.getFigure().get_size_inches() * self.backend.getFigure().get_dpi()
         return np.fromstring(self.backend.tostring_rgb(), dtype='uint8').reshape(int(height),int(width),3)
 
+    def release(self):
+        """Override"""
+        self.prefetcher.shutdown()
+
     def connect(self):
 
         self.add_connection(self.window.cursorChanged.connect(self.update))
@@ -50,6 +78,9 @@ class ImagerWindow(Window, RecordableInterface):
 
         self.add_connection(controls.undistortChanged.connect(self.update))
         self.add_connection(controls.undistortimageChanged.connect(self.update))
+        self.add_connection(controls.rasterCloudsChanged.connect(self.update))
+        self.add_connection(controls.displayResolutionChanged.connect(self.update))
+        self.add_connection(controls.segmentationImageChanged.connect(self.update))
         self.add_connection(controls.showActorChanged.connect(self.update))
         self.add_connection(controls.pointSizeChanged.connect(self.update))
         self.add_connection(controls.useColorsChanged.connect(self.update))
@@ -70,6 +101,10 @@ class ImagerWindow(Window, RecordableInterface):
         self.add_connection(controls.cropTopChanged.connect(self.update_aspect_ratio))
         self.add_connection(controls.cropBottomChanged.connect(self.update_aspect_ratio))
 
+        self.ax.callbacks.connect('xlim_changed', self.__on_view_changed)
+        self.ax.callbacks.connect('ylim_changed', self.__on_view_changed)
+        self.backend.mpl_connect('resize_event', self.__on_view_changed)
+
         self.update()
 
     def update(self):
@@ -79,21 +114,24 @@ class ImagerWindow(Window, RecordableInterface):
 
         cursor = int(self.cursor)
 
-        sample:Image = self.platform[self.datasource][cursor]
-        image = sample.get_image(undistort = self.undistortimage)
+        sample:Image = self.prefetcher.sample(cursor)
+        self.scale = self.__get_display_scale()
+        roi = self.__get_crop_roi()
+        # the sample's image is only decoded by the prefetcher, overlays are projected with the shape it returns
+        image, self.image_shape = self.prefetcher.get_image(cursor, self.undistortimage, roi, self.scale)
+        self.prefetcher.prefetch(cursor, self.undistortimage, roi, self.scale)
 
         self.__update_actors(sample)
-        self.__update_box2D(sample, image)
-        self.__update_seg_2d(sample, image)
+        self.__update_box2D(sample)
+        self.__update_seg_2d(sample)
         self.__update_bbox_3d(sample)
-        self.__update_lanes(sample, image)
+        self.__update_lanes(sample)
 
-        self.__draw(image)
+        self.__draw(image, roi)
         self.video_recorder.record(self.is_recording)
 
     def update_aspect_ratio(self):
-        im = self.ax.get_images()
-        extent =  im[0].get_extent()
+        extent =  self.image.get_extent()
         self.ax.set_aspect(abs((extent[1]-extent[0])/(extent[3]-extent[2]))/self.aspect_ratio)
         self.update()
 
@@ -124,10 +162,52 @@ class ImagerWindow(Window, RecordableInterface):
             points_mask = np.all(points_mask[indices], axis=1)
         return indices[points_mask]
 
+    def __project_cloud(self, sample:Image, cloud_sample, datasource_name):
+        key = (datasource_name, cloud_sample.index, self.datasource, sample.index, self.undistort, self.undistortimage, self.extrinsics_version)
+        projection = self.projection_cache.get(key)
+        if projection is not None:
+            return projection
+
+        self.__watch_extrinsics(datasource_name)
+
+        if isinstance(cloud_sample, PointCloud):
+
+            points = cloud_sample.get_point_cloud(referential = self.datasource, undistort = self.undistort, reference_ts = int(sample.timestamp), dtype=self.__cloud_dtype())
+            amplitudes = cloud_sample.get_field('i')
+
+            # FIXME: dirty hack to get a valid field from a PointCloud without 'i' in its fields (radars)
+            if amplitudes is None:
+                amplitudes = np.clip(cloud_sample.get_field(cloud_sample.fields[3]), 0.01, np.inf)
+
+            indices = np.arange(cloud_sample.size)
+
+        elif isinstance(cloud_sample, Echo):
+            points, amplitudes, indices = cloud_sample.get_cloud(referential = self.datasource, undistort = self.undistort, reference_ts = int(sample.timestamp), dtype=self.__cloud_dtype())
+
+        pts2d, points_mask = project_pts(sample, points, self.image_shape, undistorted=self.undistortimage)
+
+        fov_indices = self.__filter_indices(points_mask, indices)
+
+        return self.projection_cache.put(key, (amplitudes, indices, pts2d, points[:,2], points_mask, fov_indices))
+
+    def __cloud_dtype(self):
+        # motion compensation is done in float64
+        return np.float32 if COMPACT_CLOUDS and not self.undistort else np.float64
+
+    def __watch_extrinsics(self, datasource_name):
+        for ds_name in [datasource_name, self.datasource]:
+            sensor = self.platform.sensors[extract_sensor_id(ds_name)]
+            sensor.extrinsics_dirty.connect(self.__on_extrinsics_dirty) # connect() ignores duplicates
+
+    def __on_extrinsics_dirty(self):
+        self.extrinsics_version += 1
+        self.projection_cache.clear()
+
     def __update_actors(self, sample:Image):
         datasources = [ds_name for ds_name, show in dict(self.show_actor, **dict(self.show_seg_3d)).items() if show]
 
         all_points2D = dict()
+        all_depths = dict()
         all_colors = dict()
         all_indices = dict()
         for datasource_name in datasources:
@@ -141,52 +221,35 @@ class ImagerWindow(Window, RecordableInterface):
             cloud_sample = self.__get_sample(sample, datasource_name)
 
             try:
-
-                if isinstance(cloud_sample, PointCloud):
-
-                    points = cloud_sample.get_point_cloud(referential = self.datasource, undistort = self.undistort, reference_ts = int(sample.timestamp), dtype=np.float64)
-                    amplitudes = cloud_sample.get_field('i')
-
-                    # FIXME: dirty hack to get a valid field from a PointCloud without 'i' in its fields (radars)
-                    if amplitudes is None:
-                        amplitudes = np.clip(cloud_sample.get_field(cloud_sample.fields[3]), 0.01, np.inf)
-
-                    indices = np.arange(cloud_sample.size)
-
-                elif isinstance(cloud_sample, Echo):
-                    points, amplitudes, indices = cloud_sample.get_cloud(referential = self.datasource, undistort = self.undistort, reference_ts = int(sample.timestamp), dtype=np.float64)           
-
+                amplitudes, indices, pts2d, depths, points_mask, fov_indices = self.__project_cloud(sample, cloud_sample, datasource_name)
             except Sensor.NoPathToReferential as e:
                 self.has_referential[datasource_name]['hasReferential'] = False
                 continue
             
-            if points.size == 0:
+            if pts2d.size == 0:
                 continue
             
             self.has_referential[datasource_name]['hasReferential'] = True
 
-            pts2d, points_mask = sample.project_pts(points, mask_fov=False, output_mask=True, undistorted=self.undistortimage)
             all_points2D[output_ds_name] = pts2d
+            all_depths[output_ds_name] = depths
 
             if is_seg3D:
                 seg_sample = self.platform[output_ds_name].get_at_timestamp(cloud_sample.timestamp)
                 mode = 'quad_cloud' if isinstance(cloud_sample, Echo) else None
-                seg_colors = seg_sample.colors(mode=mode)
-                if seg_colors.shape[0] != points.shape[0]:
+                seg_colors = seg3d_colors(seg_sample, mode=mode)
+                if seg_colors.shape[0] != pts2d.shape[0]:
                     print(f'Warning. The length ({seg_colors.shape[0]}) of the segmentation 3D data' \
-                            +f'does not match the length ({points.shape[0]}) of the point cloud.')
+                            +f'does not match the length ({pts2d.shape[0]}) of the point cloud.')
                     continue
                 all_colors[output_ds_name] = seg_colors
 
                 if self.category_filter is not '':
-                    points_mask &= seg_sample.mask_category(self.category_filter)
+                    # points_mask is cached, don't modify it in place
+                    fov_indices = self.__filter_indices(points_mask & seg_sample.mask_category(self.category_filter), indices)
                 
             elif '-rgb' in datasource_name: #TODO: generalize how colors are obtained from the sample
-                rgb_colors = np.ones((cloud_sample.size,4))
-                rgb_colors[:,0] = cloud_sample.get_field('r')/255
-                rgb_colors[:,1] = cloud_sample.get_field('g')/255
-                rgb_colors[:,2] = cloud_sample.get_field('b')/255
-                all_colors[output_ds_name] = rgb_colors
+                all_colors[output_ds_name] = rgb_field_colors(cloud_sample)
 
             else:   
                 a_min, a_max = amplitudes.min(), amplitudes.max()
@@ -196,22 +259,27 @@ class ImagerWindow(Window, RecordableInterface):
                     norm = matplotlib.colors.Normalize(amplitudes.min(), amplitudes.max())
                 
                 if self.use_colors:
-                    c = np.full((points.shape[0], 4), utils.to_numpy(QColor(self.ds_colors[datasource_name])))
+                    c = np.full((pts2d.shape[0], 4), utils.to_numpy(QColor(self.ds_colors[datasource_name])))
                     c[:,3] = (0.25 + norm(amplitudes + ((1 + a_min) if self.log_scale else 0)))/1.25 #to make sure every point is visible
                     all_colors[output_ds_name] = c
                 else:
                     all_colors[output_ds_name] = norm(amplitudes)
 
-            all_indices[output_ds_name] = self.__filter_indices(points_mask, indices)
+            all_indices[output_ds_name] = fov_indices
 
 
 
         self.window.hasReferential = self.has_referential
         self.__clean_plot_canvas()
 
+        if self.raster_clouds:
+            return self.__rasterize_clouds(all_indices, all_points2D, all_depths, all_colors)
+
         for ds_name, indices in all_indices.items():
             points2d = all_points2D[ds_name][indices]
             colors = np.squeeze(all_colors[ds_name][indices[:,0] if indices.ndim>1 else indices]) #all colors are the same in a given triangle
+            if colors.dtype == np.uint8:
+                colors = colors / 255
  
             if indices.ndim == 2:
                 if colors.ndim == 1:
@@ -219,200 +287,287 @@ class ImagerWindow(Window, RecordableInterface):
                 else:
                     poly_coll = PolyCollection(points2d, facecolors=colors, edgecolors=None, alpha=0.7)
                 self.ax.add_collection(poly_coll)
-                self.ax.figure.canvas.draw()
             else:
                 self.scatter = self.ax.scatter(points2d[:, 0], points2d[:, 1], s=self.point_size, c=colors)
 
 
-    def __update_box2D(self, sample, image):
+    def __rasterize_clouds(self, all_indices, all_points2D, all_depths, all_colors):
+        width, height = self.__decoded_size()
+        self.cloud_raster.reset((height, width))
+        scale = np.array([width/self.image_shape[1], height/self.image_shape[0]])
+
+        for ds_name, indices in all_indices.items():
+            if indices.size == 0:
+                continue
+            colors = all_colors[ds_name][indices[:,0] if indices.ndim>1 else indices] #all colors are the same in a given triangle
+            if colors.ndim == 1: # same behavior as scatter() and PolyCollection(array=...), normalized on visible points
+                colors = plt.cm.viridis(matplotlib.colors.Normalize()(colors))
+            elif colors.dtype != np.uint8:
+                colors = matplotlib.colors.to_rgba_array(colors.reshape(-1, colors.shape[-1]))
+
+            depths = all_depths[ds_name]
+            if indices.ndim == 2:
+                colors[:,3] = 178 if colors.dtype == np.uint8 else 0.7
+                self.cloud_raster.add_triangles(all_points2D[ds_name][indices]*scale, depths[indices].mean(axis=1), colors)
+            else:
+                # scatter() sizes are marker areas in points^2
+                self.cloud_raster.add_points(all_points2D[ds_name][indices]*scale, depths[indices], colors, radius = np.sqrt(self.point_size)/2*scale[0])
+
+
+    def __update_box2D(self, sample):
 
         for ds_name, show in self.show_bbox_2d.items():
+            overlay = self.__get_overlay(('box2d', ds_name), PolygonsOverlay)
+            overlay.hide()
             if not show: continue
 
             box_source = categories.get_source(parse_datasource_name(ds_name)[2])
             box2d:Box2d = self.platform[ds_name].get_at_timestamp(sample.timestamp)
             if np.abs(float(box2d.timestamp) - float(sample.timestamp)) > 1e6: continue
-            category_numbers = box2d.get_category_numbers()
 
-            for box_index in range(len(box2d)):
+            confidences = confidences_array(box2d.get_confidences())
+            mask, names, colors = filter_boxes(box_source, box2d.get_category_numbers(), confidences, self.conf_threshold, self.category_filter)
 
-                center = box2d.get_centers()[box_index]
-                dimension = box2d.get_dimensions()[box_index]
-                confidence = box2d.get_confidences()[box_index]
-                category_name, color = categories.get_name_color(box_source, category_numbers[box_index])
-                id = box2d.get_ids()[box_index]
+            centers = box2d.get_centers()[mask]
+            dimensions = box2d.get_dimensions()[mask]
+            colors = colors[mask]
+            if self.use_box_colors:
+                colors[:] = utils.to_numpy(QColor(self.box_3d_colors[ds_name]))[:3]
 
-                if confidence:
-                    if confidence < self.conf_threshold: continue
+            top = (centers[:,0] - dimensions[:,0]/2)*self.image_shape[0]
+            left = (centers[:,1] - dimensions[:,1]/2)*self.image_shape[1]
+            bottom = top + dimensions[:,0]*self.image_shape[0]
+            right = left + dimensions[:,1]*self.image_shape[1]
+            verts = np.stack([np.stack([left, top], axis=1)
+                            , np.stack([right, top], axis=1)
+                            , np.stack([right, bottom], axis=1)
+                            , np.stack([left, bottom], axis=1)], axis=1)
 
-                if self.category_filter is not '': 
-                    if category_name not in self.category_filter: continue
+            facecolors = np.hstack([colors, np.full((colors.shape[0], 1), 0.15)])
 
-                color = np.array(color)/255
-                if self.use_box_colors:
-                    color = utils.to_numpy(QColor(self.box_3d_colors[ds_name]))[:3]
+            labels, label_positions = [], []
+            if self.box_labels_size > 0:
+                labels = box_labels(names[mask], np.asarray(box2d.get_ids())[mask], confidences[mask])
+                label_positions = np.stack([left, top], axis=1)
 
-                top = (center[0]-dimension[0]/2)*image.shape[0]
-                left = (center[1]-dimension[1]/2)*image.shape[1]
+            overlay.update(verts, colors, facecolors, linewidths=1, label_positions=label_positions, labels=labels, fontsize=self.box_labels_size)
 
-                rect = Rectangle((left,top), dimension[1]*image.shape[1], dimension[0]*image.shape[0], linewidth=1, edgecolor=color, facecolor=list(color)+[0.15]) 
-                self.ax.add_patch(rect)
 
-                if self.box_labels_size > 0:
-                    text_label = category_name
-                    if id: text_label += f" {id}"
-                    if confidence: text_label += f" ({int(confidence*100)}%)"
-                    txt = self.ax.text(left, top, text_label, color='w', fontweight='bold', fontsize=self.box_labels_size, clip_on=True)
-                    txt.set_path_effects([PathEffects.withStroke(linewidth=1, foreground='k')])
+    def __update_seg_2d(self, sample):
 
+        for ds_name, show in self.show_seg_2d.items():
+            image_overlay = self.__get_overlay(('seg2d-image', ds_name), ImageOverlay)
+            polygons_overlay = self.__get_overlay(('seg2d', ds_name), PolygonsOverlay)
+            image_overlay.hide()
+            polygons_overlay.hide()
+            if not show: continue
 
-    def __update_seg_2d(self, sample, image):
-        datasources = [ds_name for ds_name, show in self.show_seg_2d.items() if show]
-        for ds_name in datasources:
             seg_sample = self.platform[ds_name].get_at_timestamp(sample.timestamp)
-            _, _, ds_type = parse_datasource_name(ds_name)
-            annotation_source = categories.get_source(ds_type)
-            if np.abs(np.int64(sample.timestamp) - seg_sample.timestamp) <= 1e6:
-                if 'poly2d' in ds_name:
-                    raw = seg_sample.raw
-                    poly2d = raw['data']
-                    if 'confidence' in raw:
-                        mask = raw['confidence'] > self.conf_threshold
-                        poly2d = poly2d[mask]
-                elif 'seg2d' in ds_name:
-                    poly2d = seg_sample.poly2d(self.conf_threshold)
-                for poly in poly2d:
-                    name, color = categories.get_name_color(annotation_source, poly['classes'])
-                    if self.category_filter is not '':
-                        if name not in self.category_filter:
-                            break
-                    color = np.array(color)/255
-                    patch = Polygon(poly['polygon'], closed=True,linewidth=1,edgecolor=color,facecolor=list(color)+[0.15])
-                    self.ax.add_patch(patch)
+            if np.abs(np.int64(sample.timestamp) - seg_sample.timestamp) > 1e6: continue
+            annotation_source = categories.get_source(parse_datasource_name(ds_name)[2])
+
+            if self.segmentation_image:
+                key = (ds_name, seg_sample.index, self.conf_threshold, self.category_filter)
+                rgba = self.segmentation_cache.get(key)
+                if rgba is None:
+                    rgba = self.segmentation_cache.put(key, segmentation_image(self.__get_seg_labels(ds_name, seg_sample), annotation_source, self.category_filter))
+                image_overlay.update(rgba, [0, rgba.shape[1], rgba.shape[0], 0])
+                continue
+
+            poly2d = self.__get_polygons(ds_name, seg_sample)
+            mask, _, colors = filter_boxes(annotation_source, poly2d['classes'], np.full(len(poly2d), np.nan), self.conf_threshold, self.category_filter)
+            colors = colors[mask]
+            facecolors = np.hstack([colors, np.full((colors.shape[0], 1), 0.15)])
+            polygons_overlay.update(list(poly2d['polygon'][mask]), colors, facecolors, linewidths=1)
+
+    def __get_seg_labels(self, ds_name, seg_sample):
+        if 'poly2d' in ds_name:
+            return poly2d_labels(seg_sample.raw, self.conf_threshold)
+        elif 'seg2dimg' in ds_name:
+            return seg_sample.raw
+        return seg2d_labels(seg_sample.raw, self.conf_threshold)
+
+    def __get_polygons(self, ds_name, seg_sample):
+        key = (ds_name, seg_sample.index, self.conf_threshold)
+        poly2d = self.polygons_cache.get(key)
+        if poly2d is not None:
+            return poly2d
+
+        if 'poly2d' in ds_name:
+            raw = seg_sample.raw
+            poly2d = raw['data']
+            if 'confidence' in raw:
+                mask = raw['confidence'] > self.conf_threshold
+                poly2d = poly2d[mask]
+        elif 'seg2d' in ds_name:
+            poly2d = seg_sample.poly2d(self.conf_threshold)
+        return self.polygons_cache.put(key, poly2d)
 
 
     def __update_bbox_3d(self, sample:Image):
 
         for ds_name, show in self.show_bbox_3d.items():
+            overlay = self.__get_overlay(('box3d', ds_name), PolygonsOverlay)
+            overlay.hide()
             if not show: continue
 
             box_source = categories.get_source(parse_datasource_name(ds_name)[2])
             box3d_sample:Box3d = self.platform[ds_name].get_at_timestamp(sample.timestamp)
             if np.abs(float(box3d_sample.timestamp) - float(sample.timestamp)) > 1e6: continue
             box3d = box3d_sample.set_referential(self.datasource, ignore_orientation=True)
-            category_numbers = box3d.get_category_numbers()
 
-            poly_collection = []
-            color_collection = []
+            confidences = confidences_array(box3d.get_confidences())
+            mask, names, colors = filter_boxes(box_source, box3d.get_category_numbers(), confidences, self.conf_threshold, self.category_filter)
+            if not np.any(mask): continue
 
-            for box_index in range(len(box3d)):
+            vertices = bboxes_to_8coordinates(box3d.get_centers()[mask], box3d.get_dimensions()[mask], box3d.get_rotations()[mask])
+            n_boxes = vertices.shape[0]
+            p, mask_fov = project_pts(sample, vertices.reshape(-1, 3), self.image_shape, undistorted=self.undistortimage, margin=1000)
+            p = p.reshape(n_boxes, 8, 2)
+            in_fov = np.all(mask_fov.reshape(n_boxes, 8), axis=1)
 
-                center = box3d.get_centers()[box_index]
-                dimension = box3d.get_dimensions()[box_index]
-                rotation = box3d.get_rotations()[box_index]
-                confidence = box3d.get_confidences()[box_index]
-                category_name, color = categories.get_name_color(box_source, category_numbers[box_index])
-                id = box3d.get_ids()[box_index]
+            p = p[in_fov]
+            colors = colors[mask][in_fov]
+            if self.use_box_colors:
+                colors[:] = utils.to_numpy(QColor(self.box_3d_colors[ds_name]))[:3]
 
-                if confidence:
-                    if confidence < self.conf_threshold: continue
-
-                if self.category_filter is not '': 
-                    if category_name not in self.category_filter: continue
-
-                color = np.array(color)/255
-                if self.use_box_colors:
-                    color = utils.to_numpy(QColor(self.box_3d_colors[ds_name]))[:3]
-
-                vertices = linalg.bbox_to_8coordinates(center, dimension, rotation)
-                p, mask_fov = sample.project_pts(vertices, mask_fov=False, output_mask=True, undistorted=self.undistortimage, margin=1000)
-                if p[mask_fov].shape[0] < 8: continue
-
-                faces = [[0,1,3,2],[0,1,5,4],[0,2,6,4],[7,3,1,5],[7,5,4,6],[7,6,2,3]]
-                for face in faces:
-                    poly = np.vstack([p[face[0]],p[face[1]],p[face[2]],p[face[3]],p[face[0]]])
-                    poly_collection.append(poly)
-                    color_collection.append(color)
+            polygons = p[:, BOX_FACES].reshape(-1, BOX_FACES.shape[1], 2)
+            edgecolors = np.repeat(colors, BOX_FACES.shape[0], axis=0)
+            alpha = 0.05
+            facecolors = np.hstack([edgecolors, np.full((edgecolors.shape[0], 1), alpha)])
 
-                if self.box_labels_size > 0:
-                    text_label = category_name
-                    if id: text_label += f" {id}"
-                    if confidence: text_label += f" ({int(confidence*100)}%)"
-                    txt = self.ax.text(p[:,0].min(),p[:,1].min(), text_label, color='w', fontweight='bold', fontsize=self.box_labels_size, clip_on=True)
-                    txt.set_path_effects([PathEffects.withStroke(linewidth=1, foreground='k')])
+            labels, label_positions = [], []
+            if self.box_labels_size > 0:
+                labels = box_labels(names[mask][in_fov], np.asarray(box3d.get_ids())[mask][in_fov], confidences[mask][in_fov])
+                label_positions = np.stack([p[:,:,0].min(axis=1), p[:,:,1].min(axis=1)], axis=1)
 
-            alpha = 0.05
-            facecolors = [list(c)+[alpha] for c in color_collection]
-            poly_collection = PolyCollection(poly_collection, linewidths=0.5, edgecolors=color_collection, facecolors=facecolors)
-            self.ax.add_collection(poly_collection)
+            overlay.update(polygons, edgecolors, facecolors, linewidths=0.5, label_positions=label_positions, labels=labels, fontsize=self.box_labels_size)
 
 
-    def __update_lanes(self, sample, image):
+    def __update_lanes(self, sample):
 
-        # Remove all previous lines
-        [p.remove() for p in reversed(self.ax.lines)]
+        lines = {'-': ([], []), '--': ([], [])} # linestyle: (segments, colors)
 
         datasources = [ds_name for ds_name, show in self.show_lanes.items() if show]
         for ds_name in datasources:
             lane_sample = self.platform[ds_name].get_at_timestamp(sample.timestamp)
+            lanes = lane_sample.raw['data']
+            if len(lanes) == 0: continue
+
+            # all the lanes of a sample are transformed and projected at once
+            lengths = [len(lane['vertices']) for lane in lanes]
+            vertices = lane_sample.transform(np.concatenate([np.reshape(lane['vertices'], (-1, 3)) for lane in lanes]), self.datasource, ignore_orientation=True)
+            projected, mask = project_pts(sample, vertices, self.image_shape, undistorted=self.undistortimage, margin=300)
+            projected = np.reshape(projected, (-1, 2))
+            mask &= projection_mask(vertices, projected, self.image_shape, margin=300)
+
+            for lane, projected_lane, lane_mask in zip(lanes, np.split(projected, np.cumsum(lengths)[:-1]), np.split(mask, np.cumsum(lengths)[:-1])):
+                projected_lane = projected_lane[lane_mask]
+                for color, offset, ls in LANE_STYLES[lane['type']]:
+                    segments, colors = lines[ls]
+                    segments.append(projected_lane + [offset, 0])
+                    colors.append(color)
+
+        for ls, (segments, colors) in lines.items():
+            overlay = self.__get_overlay(('lanes', ls), lambda ax: LinesOverlay(ax, ls))
+            if len(segments) == 0:
+                overlay.hide()
+            else:
+                overlay.update(segments, colors, linewidths=1)
 
-            for lane in lane_sample.raw['data']:
-
-                vertices = lane_sample.transform(lane['vertices'], self.datasource, ignore_orientation=True)
-                projected_lane = sample.project_pts(vertices, undistorted=self.undistortimage, mask_fov=True, margin=300) 
-                
-                infos = lane_types.LANE_TYPES[lane['type']]
-
-                color = np.array(infos['color'])/255
-
-                width = 1
-                offset = width if infos['double'] else 0
-                nb_lanes = 2 if infos['double'] else 1
-
-                for n in range(nb_lanes):
-
-                    ddashed = infos['dashed'][n] if infos['double'] else infos['dashed']
-                    ls = '--' if ddashed else '-'
-                    
-                    self.ax.plot(projected_lane[:,0]-offset, projected_lane[:,1], c=color, lw=width, ls=ls)
-
-                    offset *= -1
 
+    def __get_overlay(self, key, overlay_class):
+        if key not in self.overlays:
+            self.overlays[key] = overlay_class(self.ax)
+        return self.overlays[key]
 
     def __clean_plot_canvas(self):
         #TODO: Extract to function
                 # if using colors, set_array does not work, it expects a 1D array, probably indexing an hidden color map
                 # so we better throw away existing scatter and start over...
-        [p.remove() for p in reversed(self.ax.texts)]
+        persistent = set(artist for overlay in self.overlays.values() for artist in overlay.artists())
+        [p.remove() for p in reversed(self.ax.texts) if p not in persistent]
         if self.scatter is not None:
             self.scatter.set_offsets(np.empty((0,2), 'f4'))
             self.scatter.set_array(np.empty((0,), 'f4'))
             self.scatter.set_sizes(np.empty((0,), 'f4'))
             self.scatter = None
-        for collection in self.ax.collections:
-            self.ax.collections.remove(collection)
-
-
-    def __draw(self, image):
-
-        self.crops = self.__assert_crop_values(image)
-        image_cropped = image[self.crops[2]:image.shape[0]-self.crops[3],self.crops[0]:image.shape[1]-self.crops[1]]
+        [c.remove() for c in reversed(self.ax.collections) if c not in persistent]
+
+
+    def __get_display_scale(self):
+        if not self.display_resolution or self.image is None or self.image_shape is None:
+            return 1
+        # screen pixels per image pixel, higher when zoomed in
+        (x0, x1), (y0, y1) = self.ax.get_xlim(), self.ax.get_ylim()
+        needed = max(self.ax.bbox.width/max(abs(x1-x0), 1), self.ax.bbox.height/max(abs(y1-y0), 1))
+        return next((scale for scale in DISPLAY_SCALES if scale >= needed), 1)
+
+    def __on_view_changed(self, *args):
+        if self.image is not None and self.__get_display_scale() != self.scale:
+            QTimer.singleShot(0, self.update)
+
+    def __decoded_size(self):
+        '''(width, height) of the images decoded at the current scale'''
+        return scaled_size((self.image_shape[1], self.image_shape[0]), self.scale)
+
+    def __get_crop_roi(self):
+        '''crops, in the coordinates of the decoded image'''
+        if self.image_shape is None:
+            return None
+        self.crops = self.__assert_crop_values(self.image_shape)
+        if not any(self.crops):
+            return None
+        height, width = self.image_shape[:2]
+        sx, sy = np.array(self.__decoded_size())/[width, height]
+        return (int(round(self.crops[0]*sx)), int(round(self.crops[2]*sy)), int(round((width-self.crops[1])*sx)), int(round((height-self.crops[3])*sy)))
+
+    def __draw(self, image, roi):
+
+        if roi is None:
+            # either not cropped, or the image shape was unknown when decoding
+            roi = self.__get_crop_roi() or (0, 0, image.shape[1], image.shape[0])
+            image = image[roi[1]:roi[3],roi[0]:roi[2]]
+        self.roi = roi
 
         if self.image is None:
-            self.image = self.ax.imshow(image_cropped, aspect=self.aspect_ratio)
+            self.image = self.ax.imshow(image, aspect=self.aspect_ratio)
             self.ax.spines["top"].set_visible(False)
             self.ax.spines["right"].set_visible(False)
             self.ax.spines["bottom"].set_visible(False)
             self.ax.spines["left"].set_visible(False)
         else:
-            self.image.set_data(image_cropped)
+            self.image.set_data(image)
+
+        # overlays are in full resolution image coordinates
+        height, width = self.image_shape[:2]
+        sx, sy = np.array(self.__decoded_size())/[width, height]
+        x0, y0, x1, y1 = roi
+        self.image.set_extent([x0/sx, x1/sx, y1/sy, y0/sy])
 
-        self.image.set_extent([self.crops[0],image.shape[1]-self.crops[1],image.shape[0]-self.crops[3],self.crops[2]])
+        self.__draw_cloud_overlay()
 
-        self.backend.draw()
+        self.blit_manager.draw([*self.ax.images, *self.ax.collections, *self.ax.patches, *self.ax.lines, *self.ax.texts])
 
 
-    def __assert_crop_values(self, image):
+    def __draw_cloud_overlay(self):
+        width, height = self.__decoded_size()
+        if not self.raster_clouds or self.cloud_raster.shape != (height, width) or self.cloud_raster.is_empty():
+            if self.cloud_overlay is not None:
+                self.cloud_overlay.set_visible(False)
+            return
+
+        x0, y0, x1, y1 = self.roi
+        rgba = self.cloud_raster.rgba[y0:y1,x0:x1]
+        if self.cloud_overlay is None:
+            # above the camera image, below the annotations
+            self.cloud_overlay = self.ax.imshow(rgba, aspect=self.ax.get_aspect(), interpolation='nearest', zorder=0.5)
+        else:
+            self.cloud_overlay.set_data(rgba)
+        self.cloud_overlay.set_extent(self.image.get_extent())
+        self.cloud_overlay.set_visible(True)
+
+    def __assert_crop_values(self, image_shape):
         crops = []
         for crop in self.crops:
             try:
@@ -421,10 +576,10 @@ class ImagerWindow(Window, RecordableInterface):
             except:
                 crop = 0
             crops.append(crop)
-        crops[0] = np.clip(crops[0], 0, int(image.shape[1]/2))
-        crops[1] = np.clip(crops[1], 0, int(image.shape[1]/2))
-        crops[2] = np.clip(crops[2], 0, int(image.shape[0]/2))
-        crops[3] = np.clip(crops[3], 0, int(image.shape[0]/2))
+        crops[0] = np.clip(crops[0], 0, int(image_shape[1]/2))
+        crops[1] = np.clip(crops[1], 0, int(image_shape[1]/2))
+        crops[2] = np.clip(crops[2], 0, int(image_shape[0]/2))
+        crops[3] = np.clip(crops[3], 0, int(image_shape[0]/2))
         return crops
 
 
@@ -437,6 +592,9 @@ class ImagerWindow(Window, RecordableInterface):
         self.player_cursor         = int(self.window.playerCursor)
 
         self.show_actor            =        controls.showActor
+        self.raster_clouds         = bool(  controls.rasterClouds)
+        self.segmentation_image    = bool(  controls.segmentationImage)
+        self.display_resolution    = bool(  controls.displayResolution)
         self.show_bbox_2d          =        controls.showBBox2D
         self.show_seg_2d           =        controls.showSeg2D
         self.show_bbox_3d          =        controls.showBBox3D
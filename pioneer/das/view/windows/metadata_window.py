@@ -4,6 +4,7 @@ from pioneer.das.api.categories import get_category_number
 from pioneer.das.api.datasources import VirtualDatasource
 from pioneer.das.tests import validate_imu_flow as vif
 from pioneer.das.view.windows import Window
+from pioneer.das.view.windows.blitting import BlitManager
 
 from PyQt5.QtQml import QQmlComponent, QQmlProperty, QQmlEngine
 from PyQt5.QtCore import QObject
@@ -39,6 +40,9 @@ class MetadataWindow(Window):
         self.synchronized = synchronized
         self.backend = self.window.findChild(QObject, "figure")
         self.ax = self.backend.getFigure().add_subplot(111)
+        self.blit_manager = BlitManager(self.backend)
+        self.lines = {} # column -> Line2D
+        self.legend_columns = None
         
         if self.platform.metadata is not None:
             if len(self.platform.metadata) != len(self.synchronized):
@@ -150,17 +154,40 @@ class MetadataWindow(Window):
 
 
     def _update_plot(self):
-        self.ax.clear()
-        has_legend = False
-        for column_name, show in self.window.showColumn.items():
-            if show:
-                try:
-                    self.ax.plot(self.metadata_dirty[column_name], label=f'{column_name}')
-                except: pass
-                has_legend = True
-        if has_legend:
-            self.ax.legend()
-        self.backend.draw()
+        shown = [c for c, show in self.window.showColumn.items() if show]
+        for column_name in shown:
+            try:
+                column = self.metadata_dirty[column_name]
+                values = np.asarray(column.values, dtype='f8')
+            except: continue
+            if column_name not in self.lines:
+                self.lines[column_name], = self.ax.plot(column.index, values, label=f'{column_name}')
+            else:
+                self.lines[column_name].set_data(column.index, values)
+        for column_name, line in self.lines.items():
+            line.set_visible(column_name in shown)
+
+        # limits and legend change only with the data or the shown columns, otherwise the plot is blitted
+        visible = [line for line in self.lines.values() if line.get_visible()]
+        if shown != self.legend_columns or not self._in_view(visible):
+            self.legend_columns = shown
+            self.ax.relim(visible_only = True)
+            self.ax.autoscale_view()
+            if self.ax.get_legend() is not None:
+                self.ax.get_legend().remove()
+            if shown:
+                self.ax.legend(handles = visible)
+        self.blit_manager.draw([*self.lines.values(), self.ax.get_legend()])
+
+    def _in_view(self, lines):
+        (x_min, x_max), (y_min, y_max) = self.ax.get_xlim(), self.ax.get_ylim()
+        for line in lines:
+            x, y = np.asarray(line.get_xdata(), 'f8'), np.asarray(line.get_ydata(), 'f8')
+            finite = np.isfinite(x) & np.isfinite(y)
+            x, y = x[finite], y[finite]
+            if x.size > 0 and (x.min() < x_min or x.max() > x_max or y.min() < y_min or y.max() > y_max):
+                return False
+        return True
 
 
     def get_entry(self):
@@ -0,0 +1,221 @@
+from pioneer.das.api import categories, lane_types
+
+from matplotlib.collections import LineCollection, PolyCollection
+
+import cv2
+import matplotlib.patheffects as PathEffects
+import numpy as np
+
+'''
+Matplotlib overlays that keep their artists alive between frames and only update their data.
+'''
+
+def confidences_array(confidences):
+    '''Box confidences as floats, with NaN where the annotation has no confidence'''
+    if isinstance(confidences, np.ndarray):
+        return confidences.astype('f8')
+    return np.array([np.nan if c is None else c for c in confidences], dtype='f8')
+
+def filter_boxes(box_source, category_numbers, confidences, conf_threshold, category_filter):
+    '''Vectorized confidence and category filtering for box annotations.
+
+    Returns:
+        mask - (N,) boxes to keep
+        names - (N,) category names
+        colors - (N,3) category colors in [0,1]
+    '''
+    category_numbers = np.asarray(category_numbers)
+    unique_numbers, inverse = np.unique(category_numbers, return_inverse = True)
+    lut = [categories.get_name_color(box_source, n) for n in unique_numbers]
+    names = np.array([name for name, _ in lut], dtype = object)[inverse.ravel()]
+    colors = np.array([color for _, color in lut], dtype = 'f8').reshape(-1, 3)[inverse.ravel()]/255
+
+    confidences = confidences_array(confidences)
+    # boxes without confidence (None or 0) are never filtered out
+    mask = ~(confidences < conf_threshold) | (confidences == 0)
+
+    if category_filter != '':
+        unique_kept = np.array([name in category_filter for name, _ in lut], dtype = bool)
+        mask &= unique_kept[inverse.ravel()]
+
+    return mask, names, colors
+
+SEGMENTATION_ALPHA = 0.15 # same as the polygons' faces
+SEGMENTATION_LUTS = {} # (source, category_filter) -> category number to RGBA lookup table
+
+def segmentation_lut(source, category_filter, size):
+    '''(size+1, 4) RGBA lookup table, indexed by category number + 1. Row 0 (no category) and filtered out categories are transparent.'''
+    key = (source, category_filter)
+    lut = SEGMENTATION_LUTS.get(key)
+    if lut is None or lut.shape[0] < size + 1:
+        lut = np.zeros((size + 1, 4), dtype = 'u1')
+        for number in range(size):
+            name, color = categories.get_name_color(source, number)
+            if category_filter != '' and name not in category_filter:
+                continue
+            lut[number + 1] = list(color) + [int(SEGMENTATION_ALPHA*255)]
+        SEGMENTATION_LUTS[key] = lut
+    return lut
+
+def segmentation_image(labels, source, category_filter):
+    '''(H,W) category numbers, -1 where there is no category -> (H,W,4) RGBA overlay, with opaque outlines'''
+    labels = labels.astype('i8') + 1
+    rgba = segmentation_lut(source, category_filter, int(labels.max()))[labels]
+
+    edges = np.zeros(labels.shape, dtype = bool)
+    horizontal = labels[:,:-1] != labels[:,1:]
+    vertical = labels[:-1] != labels[1:]
+    edges[:,:-1] |= horizontal
+    edges[:,1:] |= horizontal
+    edges[:-1] |= vertical
+    edges[1:] |= vertical
+    rgba[edges & (rgba[...,3] > 0), 3] = 255
+    return rgba
+
+def seg2d_labels(raw, confidence_threshold):
+    '''Category numbers of a seg2d sample, the most confident instance wins where instances overlap'''
+    box_confidences = raw['box_confidence'] if 'box_confidence' in raw.keys() else None
+    data = raw['data']
+    labels = np.full(data['confidences'][0].shape, -1, dtype = 'i4')
+    best = np.zeros(labels.shape, dtype = 'f4')
+    for i, seg_data in enumerate(data):
+        if box_confidences is not None and box_confidences[i] < confidence_threshold:
+            continue
+        confidences = seg_data['confidences']
+        mask = (confidences > confidence_threshold) & (confidences > best)
+        labels[mask] = seg_data['classes']
+        best[mask] = confidences[mask]
+    return labels
+
+def poly2d_labels(raw, confidence_threshold):
+    '''Category numbers of a poly2d sample, rasterized at its resolution'''
+    labels = np.full(tuple(raw['resolution'][:2]), -1, dtype = 'i4')
+    for i, poly in enumerate(raw['data']):
+        if 'confidence' in raw and raw['confidence'][i] <= confidence_threshold:
+            continue
+        cv2.fillPoly(labels, [np.asarray(poly['polygon'], dtype = 'i4')], int(poly['classes']))
+    return labels
+
+def lane_styles(infos, width = 1):
+    '''[(color, x offset, linestyle)] for each line of a lane type, double lanes are drawn as two lines'''
+    color = np.array(infos['color'])/255
+    if not infos['double']:
+        return [(color, 0, '--' if infos['dashed'] else '-')]
+    return [(color, offset, '--' if dashed else '-') for offset, dashed in zip([-width, width], infos['dashed'])]
+
+LANE_STYLES = {lane_type: lane_styles(infos) for lane_type, infos in lane_types.LANE_TYPES.items()}
+
+def box_labels(names, ids, confidences):
+    labels = []
+    for name, id, confidence in zip(names, ids, confidences):
+        label = name
+        if id: label += f" {id}"
+        if confidence and not np.isnan(confidence): label += f" ({int(confidence*100)}%)"
+        labels.append(label)
+    return labels
+
+
+class TextPool(object):
+    '''A pool of Text artists, grown on demand and hidden when unused'''
+    def __init__(self, ax):
+        self.ax = ax
+        self.texts = []
+
+    def update(self, positions, labels, fontsize):
+        while len(self.texts) < len(labels):
+            txt = self.ax.text(0, 0, '', color='w', fontweight='bold', clip_on=True)
+            txt.set_path_effects([PathEffects.withStroke(linewidth=1, foreground='k')])
+            self.texts.append(txt)
+
+        for txt, position, label in zip(self.texts, positions, labels):
+            txt.set_position(position)
+            txt.set_text(label)
+            txt.set_fontsize(fontsize)
+            txt.set_visible(True)
+
+        for txt in self.texts[len(labels):]:
+            txt.set_visible(False)
+
+    def hide(self):
+        for txt in self.texts:
+            txt.set_visible(False)
+
+    def artists(self):
+        return list(self.texts)
+
+
+class PolygonsOverlay(object):
+    '''Polygons drawn through a single PolyCollection, with pooled labels'''
+    def __init__(self, ax):
+        self.ax = ax
+        self.collection = None
+        self.labels = TextPool(ax)
+
+    def update(self, verts, edgecolors, facecolors, linewidths = 1, label_positions = [], labels = [], fontsize = 10):
+        if self.collection is None:
+            self.collection = PolyCollection(verts, linewidths=linewidths, edgecolors=edgecolors, facecolors=facecolors)
+            self.ax.add_collection(self.collection)
+        else:
+            self.collection.set_verts(verts)
+            self.collection.set_edgecolor(edgecolors)
+            self.collection.set_facecolor(facecolors)
+            self.collection.set_linewidth(linewidths)
+        self.collection.set_visible(True)
+
+        self.labels.update(label_positions, labels, fontsize)
+
+    def hide(self):
+        if self.collection is not None:
+            self.collection.set_visible(False)
+        self.labels.hide()
+
+    def artists(self):
+        return ([] if self.collection is None else [self.collection]) + self.labels.artists()
+
+
+class ImageOverlay(object):
+    '''An RGBA image drawn over the camera image'''
+    def __init__(self, ax, zorder = 0.6):
+        self.ax = ax
+        self.zorder = zorder
+        self.image = None
+
+    def update(self, rgba, extent):
+        if self.image is None:
+            self.image = self.ax.imshow(rgba, extent=extent, aspect=self.ax.get_aspect(), interpolation='nearest', zorder=self.zorder)
+        else:
+            self.image.set_data(rgba)
+            self.image.set_extent(extent)
+        self.image.set_visible(True)
+
+    def hide(self):
+        if self.image is not None:
+            self.image.set_visible(False)
+
+    def artists(self):
+        return [] if self.image is None else [self.image]
+
+
+class LinesOverlay(object):
+    '''Polylines sharing a line style, drawn through a single LineCollection'''
+    def __init__(self, ax, linestyle = '-'):
+        self.ax = ax
+        self.linestyle = linestyle
+        self.collection = None
+
+    def update(self, segments, colors, linewidths = 1):
+        if self.collection is None:
+            self.collection = LineCollection(segments, colors=colors, linewidths=linewidths, linestyles=self.linestyle)
+            self.ax.add_collection(self.collection)
+        else:
+            self.collection.set_segments(segments)
+            self.collection.set_color(colors)
+            self.collection.set_linewidth(linewidths)
+        self.collection.set_visible(True)
+
+    def hide(self):
+        if self.collection is not None:
+            self.collection.set_visible(False)
+
+    def artists(self):
+        return [] if self.collection is None else [self.collection]
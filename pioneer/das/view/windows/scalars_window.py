@@ -1,9 +1,13 @@
 from pioneer.das.view.windows import Window
+from pioneer.das.view.windows.blitting import BlitManager
 
 from PyQt5.QtCore import QObject
 
 import numpy as np
 
+Y_MARGIN = 0.1 # fraction of the data range added above and below, so that the y range is not reset on every update
+Y_SHRINK_RATIO = 0.5 # the y range is reset when the data spans less than this fraction of it
+
 class ScalarsWindow(Window):
 
     def __init__(self, window, platform, synchronized, ds_name):
@@ -14,8 +18,14 @@ class ScalarsWindow(Window):
 
         self.backend = self.window.findChild(QObject, "figure")
         self.ax = self.backend.getFigure().add_subplot(111)
+        self.ax.set_xlabel('relative time [s]')
+        self.blit_manager = BlitManager(self.backend)
         self.datasource = self.platform[self.ds_name]
         self.image = None
+        self.lines = {}
+        self.points = {}
+        self.legend_columns = None
+        self.view = None # (datasource, shown columns, whole dataset), the y range is reset when it changes
         
         raw_0 = self.datasource[0].raw
         if type(raw_0) == dict:
@@ -59,14 +69,16 @@ class ScalarsWindow(Window):
             final_index = self.datasource.get_at_timestamp(float(sample.timestamp) + float(self.window.endTime)*1e6).index
             indices = range(start_index, final_index)
 
-        self.ax.clear()
+        # times are relative to the cursor in a time window, to the start of the dataset otherwise, so that the x range is fixed
+        origin = float(self.datasource.timestamps[0]) if self.window.showAllDataset else float(sample.timestamp)
+        cursor_time = (float(sample.timestamp) - origin)/1e6
 
         show_column = self.window.showColumn
         markers = 'o' if self.window.markers else ''
         
         min_y = np.finfo('f4').max
         max_y = np.finfo('f4').min
-        has_legend = False
+        times = None
         for column_name, show in show_column.items():
             if show:                
                 scalar_samples = self.datasource[indices]
@@ -77,19 +89,48 @@ class ScalarsWindow(Window):
                 min_y = min(min_y, scalars.min())
                 max_y = max(max_y, scalars.max())
                 if min_y == max_y: max_y += 1
-                times = (self.datasource.timestamps[indices].astype('f8') - sample.timestamp)/1e6
-                self.ax.plot(times, scalars, marker=markers, label=column_name, color=self.colors[column_name])
+                times = (self.datasource.timestamps[indices].astype('f8') - origin)/1e6
 
-                time_zero_index = np.argmin(np.abs(times))
-                self.ax.scatter(times[time_zero_index], scalars[time_zero_index], color=self.colors[column_name])
-
-                has_legend = True
-        
-        self.ax.set_ylim([min_y,max_y])
-        self.ax.set_xlim([times.min(),times.max()])
-        if has_legend:
-            self.ax.legend()
+                if column_name not in self.lines:
+                    self.lines[column_name], = self.ax.plot([], [], label=column_name, color=self.colors[column_name])
+                    self.points[column_name], = self.ax.plot([], [], 'o', color=self.colors[column_name])
+                self.lines[column_name].set_data(times, scalars)
+                self.lines[column_name].set_marker(markers)
 
-        self.ax.set_xlabel('relative time [s]')
+                cursor_index = np.argmin(np.abs(times - cursor_time))
+                self.points[column_name].set_data([times[cursor_index]], [scalars[cursor_index]])
 
-        self.backend.draw()
\ No newline at end of file
+            if column_name in self.lines:
+                self.lines[column_name].set_visible(show)
+                self.points[column_name].set_visible(show)
+        
+        legend_columns = [c for c, show in show_column.items() if show]
+        if times is not None:
+            view = (self.ds_name, tuple(legend_columns), bool(self.window.showAllDataset))
+            self._update_limits(times, min_y, max_y, reset_y = view != self.view)
+            self.view = view
+
+        if legend_columns != self.legend_columns:
+            self.legend_columns = legend_columns
+            if legend_columns:
+                self.ax.legend(handles=[self.lines[c] for c in legend_columns])
+            elif self.ax.get_legend() is not None:
+                self.ax.get_legend().remove()
+
+        self.blit_manager.draw([*self.lines.values(), *self.points.values(), self.ax.get_legend()])
+
+    def _update_limits(self, times, min_y, max_y, reset_y = False):
+        '''Changes the axes limits only when needed, as any change of limits costs a full redraw instead of a blit.
+        The y range is reset when the shown data changes, when it goes out of range, or once an outlier left it.'''
+        if self.window.showAllDataset:
+            x_lim = (times.min(), times.max())
+        else:
+            x_lim = (float(self.window.startTime), float(self.window.endTime))
+        if tuple(self.ax.get_xlim()) != x_lim:
+            self.ax.set_xlim(x_lim)
+
+        y_min, y_max = self.ax.get_ylim()
+        shrunk = (max_y - min_y) * (1 + 2 * Y_MARGIN) < Y_SHRINK_RATIO * (y_max - y_min)
+        if reset_y or shrunk or min_y < y_min or max_y > y_max:
+            margin = (max_y - min_y) * Y_MARGIN
+            self.ax.set_ylim([min_y - margin, max_y + margin])
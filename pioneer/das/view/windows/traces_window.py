@@ -2,12 +2,17 @@ from pioneer.common import platform as platform_utils
 from pioneer.common.trace_processing import TraceProcessingCollection, Smooth, Clip, ZeroBaseline, Realign, RemoveStaticNoise, Desaturate
 from pioneer.common import clouds
 from pioneer.das.api.samples import FastTrace, Echo
+from pioneer.das.view.echo_images import echo_images, placeholder_indices
+from pioneer.das.view.picking import channel_echoes
+from pioneer.das.view.trace_cache import processed_traces, processing_key, store_directory, ProcessedTraceStore
+from pioneer.das.view.waterfall import WATERFALL_REFRESH_MS, WaterfallStream, uncached_sample
 from pioneer.das.view.windows import Window
+from pioneer.das.view.windows.blitting import BlitManager
 
 from pioneer.common.gui.qml import backend_qtquick5
 
 from enum import Enum
-from PyQt5.QtCore import QObject
+from PyQt5.QtCore import QObject, QTimer
 
 import copy
 import matplotlib.pyplot as plt
@@ -30,6 +35,7 @@ class TracesWindow(Window):
         self.backend = self.window.findChild(QObject, "figure")
         self.figure = self.backend.getFigure()
         self.ax = [self.figure.add_subplot(s) for s in [211, 212]]
+        self.blit_manager = BlitManager(self.backend)
         self.datasource = self.platform[self.ds_name]
 
         sensor_name, sensor_pos, trr_ds_type = platform_utils.parse_datasource_name(self.ds_name)
@@ -41,12 +47,31 @@ class TracesWindow(Window):
             self.window.useVirtualEchoes.visible = True
 
         self.helper = None
+        self.channel_grid = None # image coordinates -> channel index
+        self.channel_coords = None # channel index -> image coordinates
+        self.channel_echoes = None
+        self.placeholder = (None, None) # (trace sample index, placeholder echo sample)
         self.image = None
         self.hover_coords = None
         self.hovering = False
         self.selection = []
         self.trace_processing = None
+        self.trace_processing_key = None
+        self.trace_stores = {} # fast trace type -> ProcessedTraceStore, if processed traces are persisted
         self.drawn_traces = []
+        self.lines = {} # (channel, variant) -> Line2D of the selected channels
+        self.shown_lines = []
+        self.hover_marker = None
+        self.hover_text = None
+        self.hover_lines = {} # variant -> Line2D of the hovered channel
+
+        self.waterfall = None
+        self.waterfall_key = None
+        self.waterfall_ax = None
+        self.waterfall_image = None
+        self.waterfall_shown = 0
+        self.waterfall_timer = QTimer()
+        self.waterfall_timer.timeout.connect(self._refresh_waterfall)
 
         if self.datasource.sensor.static_noise is None or self.datasource.sensor.static_noise == 0:
             self.window.removeStaticVisible = False
@@ -68,6 +93,8 @@ class TracesWindow(Window):
         self.add_connection(self.window.zeroBaselineChanged.connect(self._update_trace_processing))
         self.add_connection(self.window.cutoffChanged.connect(self._update_trace_processing))
         self.add_connection(self.window.smoothTraceChanged.connect(self._update_trace_processing))
+        self.add_connection(self.window.waterfallChanged.connect(self._update))
+        self.add_connection(self.window.waterfallFramesChanged.connect(self._update))
 
         self.backend.canvas.mpl_connect('motion_notify_event', self._on_hover)
         self.backend.canvas.mpl_connect('button_press_event', self._on_click)
@@ -76,13 +103,21 @@ class TracesWindow(Window):
         self._update()
 
 
+    def release(self):
+        '''Override'''
+        self._shutdown_trace_stores()
+        if self.waterfall is not None:
+            self.waterfall.cancel()
+        self.waterfall = None
+        self.waterfall_key = None
+        self.waterfall_timer.stop()
+
+
     def _update(self):
 
         cursor = int(self.window['cursor'])
         self.trace_sample = self.datasource[cursor]
-
-        if self.window.traceProcessing:
-            self.trace_processed = self.trace_sample.processed(self.trace_processing)
+        self._fill_trace_stores()
 
         self.selection = self.window.selection
 
@@ -92,7 +127,12 @@ class TracesWindow(Window):
 
         self._update_image()
         self._update_plots()
-        self.backend.draw()
+
+
+    def _draw(self):
+        waterfall = self.waterfall_ax is not None and self.waterfall_ax.get_visible()
+        plots = [self.waterfall_image] if waterfall else self.ax[1].lines
+        self.blit_manager.draw([self.image, *self.ax[0].lines, self.hover_text, *plots])
 
 
     def _update_image(self):
@@ -103,15 +143,10 @@ class TracesWindow(Window):
             self.echo_sample = self.platform[self.ech_ds_name].get_at_timestamp(self.trace_sample.timestamp)
         else:
             self.echo_sample = self._placeholder_echo_sample()
+        self.channel_echoes = channel_echoes(self.echo_sample)
 
-        if self.window.imageType == 'distance':
-            image = self.echo_sample.distance_img(options='max_amplitude')
-        elif self.window.imageType == 'width':
-            image = self.echo_sample.other_field_img('widths')
-        elif self.window.imageType == 'skew':
-            image = self.echo_sample.other_field_img('skews')
-        else:
-            image = self.echo_sample.amplitude_img()
+        images = echo_images(self.echo_sample)
+        image = images.get(self.window.imageType, images['amplitude'])
 
         if self.image is None:
             self.image = self.ax[0].imshow(image, extent=[0, image.shape[1], image.shape[0], 0])
@@ -121,23 +156,59 @@ class TracesWindow(Window):
 
         if self.helper is None: 
             self.helper = backend_qtquick5.MPLImageHelper(image, self.ax[0], offset = 0)
-            self.helper.image_coord_to_channel_index = self.echo_sample.image_coord_to_channel_index
-            self.helper.channel_index_to_image_coord = self.echo_sample.channel_index_to_image_coord
+            self.channel_grid = np.array(self.echo_sample.coords_img_tf[..., 2])
+            self.channel_coords = np.empty((self.channel_grid.size, 2), int)
+            self.channel_coords[self.channel_grid.ravel()] = np.argwhere(np.ones(self.channel_grid.shape, bool))
+            self.helper.image_coord_to_channel_index = lambda row, col: self.channel_grid[row, col]
+            self.helper.channel_index_to_image_coord = lambda index: self.channel_coords[index]
 
 
     def _update_plots(self):
-        self._clear_plots()
-        if len(self.selection) > 0:
-            for coords in self.selection:
-                row, col = coords
-                index = self.helper.image_coord_to_channel_index(row, col)
-                color = COLORS[index%len(COLORS)]
-                marker_style = dict(color=color, marker='s', markersize=4, markerfacecolor=color, markeredgecolor = 'white')
-                self.ax[0].plot(col+.5, row+.5, **marker_style)
-                self.draw_traces(index, color)
+        indices = [self.helper.image_coord_to_channel_index(row, col) for row, col in self.selection]
+        self._process_traces(indices)
+
+        wanted = {}
+        for (row, col), index in zip(self.selection, indices):
+            color = COLORS[index%len(COLORS)]
+            marker_style = dict(color=color, marker='s', markersize=4, markerfacecolor=color, markeredgecolor = 'white')
+            wanted[(index, 'marker')] = (self.ax[0], [col+.5], [row+.5], marker_style)
+            for variant, trace, ls, label in self._traces(index):
+                wanted[(index, variant)] = (self.ax[1], None, trace, dict(color=color, ls=ls, label=label))
+
+        for key in [key for key in self.lines if key not in wanted]:
+            self.lines.pop(key).remove()
+        for key, (ax, x, y, style) in wanted.items():
+            line = self.lines.get(key)
+            if line is None:
+                self.lines[key], = ax.plot(y, **style) if x is None else ax.plot(x, y, **style)
+            else:
+                self._set_line_data(line, x, y)
+
+        self.drawn_traces = [y for key, (_, _, y, _) in wanted.items() if key[1] != 'marker']
+        if list(wanted) != self.shown_lines or not self._in_plot_range(self.drawn_traces):
+            self.shown_lines = list(wanted)
             self._update_plot_range()
             self._update_legend()
-            self.backend.draw()
+        if self.hovering and self.hover_coords is not None:
+            # the hover preview follows the cursor
+            row, col = self.hover_coords
+            self._update_hover(self.helper.image_coord_to_channel_index(row, col), row, col)
+        self._update_waterfall(indices)
+        self._draw()
+
+
+    def _set_line_data(self, line, x, y):
+        if x is not None:
+            line.set_data(x, y)
+        elif len(line.get_xdata()) == len(y):
+            line.set_ydata(y)
+        else:
+            line.set_data(np.arange(len(y)), y)
+
+
+    def _in_plot_range(self, traces):
+        y_min, y_max = self.ax[1].get_ylim()
+        return all(trace.min() >= y_min and trace.max() <= y_max for trace in traces)
 
 
     def _update_legend(self):
@@ -147,10 +218,11 @@ class TracesWindow(Window):
             self.ax[1].legend()
             
 
-    def _update_plot_range(self):
-        if len(self.drawn_traces) > 0:
-            plot_range_min = min([trace.min() for trace in self.drawn_traces])
-            plot_range_max = max([trace.max() for trace in self.drawn_traces])
+    def _update_plot_range(self, traces = None):
+        traces = self.drawn_traces if traces is None else traces
+        if len(traces) > 0:
+            plot_range_min = min([trace.min() for trace in traces])
+            plot_range_max = max([trace.max() for trace in traces])
             if plot_range_max <= plot_range_min:
                 return self.ax[1].set_ylim(-0.1,1.1)
             diff = float(plot_range_max) - float(plot_range_min)
@@ -174,6 +246,9 @@ class TracesWindow(Window):
         if self.window.smoothTrace:
             list_trace_processing.append(Smooth())
         self.trace_processing = TraceProcessingCollection(list_trace_processing)
+        self.trace_processing_key = processing_key(self.trace_processing)
+        self._shutdown_trace_stores()
+        self.trace_stores = {}
         self._update()
 
 
@@ -182,6 +257,8 @@ class TracesWindow(Window):
             try: col, row = self.helper.to_indices(event.xdata, event.ydata)
             except: 
                 self.hover_coords = None
+                if self.hovering:
+                    self._leave_hover()
                 return 0
 
             index = self.helper.image_coord_to_channel_index(row, col)
@@ -189,35 +266,57 @@ class TracesWindow(Window):
                 return 0
             self.hover_coords = [row, col]
             self.hovering = True
+            self._update_hover(index, row, col)
+            self._draw()
+        elif self.hovering:
+            self.hover_coords = None
+            self._leave_hover()
+        else:
+            self.hover_coords = None
 
-            # Marker on the currently hovered channel
-            color = 'r'
-            marker_style = dict(color=color, marker='o', markersize=4, markerfacecolor=color, markeredgecolor = 'white')
-            self.ax[0].plot(col+.5, row+.5, **marker_style)
 
-            # Amplitude and distance of echo in hovered channel
-            ech_idx = np.where(self.echo_sample.indices == index)[0]
-            self.ax[0].set_title(f'amp:{self.echo_sample.amplitudes[ech_idx]}, dst:{self.echo_sample.distances[ech_idx]}')
+    def _leave_hover(self):
+        self.hovering = False
+        self._hide_hover()
+        self._update_plot_range()
+        self._draw()
+
+
+    def _update_hover(self, index, row, col):
+        '''Shows the hovered channel with dedicated artists, blitted over the plots of the selected channels'''
+        if self.hover_marker is None:
+            self.hover_marker, = self.ax[0].plot([], [], color='r', marker='o', markersize=4, markerfacecolor='r', markeredgecolor = 'white')
+            self.hover_text = self.ax[0].text(0.5, 1.01, '', transform=self.ax[0].transAxes, ha='center', va='bottom')
+
+        # Marker on the currently hovered channel
+        self.hover_marker.set_data([col+.5], [row+.5])
+        self.hover_marker.set_visible(True)
+
+        # Amplitude and distance of echo in hovered channel
+        ech_idx = self.channel_echoes.echoes(index)
+        self.hover_text.set_text(f'amp:{self.echo_sample.amplitudes[ech_idx]}, dst:{self.echo_sample.distances[ech_idx]}')
+        self.hover_text.set_visible(True)
+
+        traces = self._traces(index)
+        for variant, trace, ls, _ in traces:
+            line = self.hover_lines.get(variant)
+            if line is None:
+                self.hover_lines[variant], = self.ax[1].plot(trace, color='r', ls=ls, label='_nolegend_')
+            else:
+                self._set_line_data(line, None, trace)
+        shown = [variant for variant, _, _, _ in traces]
+        for variant, line in self.hover_lines.items():
+            line.set_visible(variant in shown)
 
-            len_drawn_traces = len(self.drawn_traces)
+        hovered_traces = [trace for _, trace, _, _ in traces]
+        if not self._in_plot_range(hovered_traces):
+            self._update_plot_range(self.drawn_traces + hovered_traces)
 
-            self.draw_traces(index, color)
-            self._update_plot_range()
-            self._update_legend()
-            self.backend.draw()
 
-            del self.ax[0].lines[-1]
-            for _ in self.drawn_traces[len_drawn_traces:]:
-                del self.ax[1].lines[-1]
-            self.drawn_traces = self.drawn_traces[:len_drawn_traces]
-        elif self.hovering:
-            self._update_plot_range()
-            self._update_legend()
-            self.backend.draw()
-            self.hover_coords = None
-            self.ax[0].set_title(f'')
-        else:
-            self.hover_coords = None
+    def _hide_hover(self):
+        for artist in [self.hover_marker, self.hover_text, *self.hover_lines.values()]:
+            if artist is not None:
+                artist.set_visible(False)
 
 
     def _on_click(self, event):
@@ -240,66 +339,173 @@ class TracesWindow(Window):
         self._update_plots()
 
 
-    def draw_traces(self, index, color):
-
+    def _traces(self, index):
+        '''(variant, trace, line style, label) of each trace shown for a channel'''
+        traces = []
         if self.window.showRaw:
 
             if isinstance(self.trace_sample, FastTrace):
                 if self.window.showHighFastTrace:
-                    trace_high = self.trace_sample.raw['high']['data'][index]
-                    self.ax[1].plot(trace_high, color=color, label=f'Raw(High): {index}')
-                    self.drawn_traces.append(trace_high)
-
+                    traces.append(('raw_high', self.trace_sample.raw['high']['data'][index], '-', f'Raw(High): {index}'))
                 if self.window.showLowFastTrace:
-                    trace_low = self.trace_sample.raw['low']['data'][index]
-                    self.ax[1].plot(trace_low, color=color, ls=':', label=f'Raw(Low): {index}')
-                    self.drawn_traces.append(trace_low)
+                    traces.append(('raw_low', self.trace_sample.raw['low']['data'][index], ':', f'Raw(Low): {index}'))
             else:
-                trace_raw = self.trace_sample.raw['data'][index]
-                self.ax[1].plot(trace_raw, color=color, label=f'Raw: {index}')
-                self.drawn_traces.append(trace_raw)
-
+                traces.append(('raw', self.trace_sample.raw['data'][index], '-', f'Raw: {index}'))
 
         if self.window.traceProcessing:
 
             if isinstance(self.trace_sample, FastTrace):
                 if self.window.showHighFastTrace:
-                    trace_processed_high = self.trace_processed['high']['data'][index]
-                    self.ax[1].plot(trace_processed_high, color=color, ls='--', label=f'Processed(High): {index}')
-                    self.drawn_traces.append(trace_processed_high)
-
+                    traces.append(('processed_high', self._processed_trace(index, 'high'), '--', f'Processed(High): {index}'))
                 if self.window.showLowFastTrace:
-                    trace_processed_low = self.trace_processed['low']['data'][index]
-                    self.ax[1].plot(trace_processed_low, color=color, ls='-.', label=f'Processed(Low): {index}')
-                    self.drawn_traces.append(trace_processed_low)
+                    traces.append(('processed_low', self._processed_trace(index, 'low'), '-.', f'Processed(Low): {index}'))
             else:
-                trace_processed = self.trace_processed['data'][index]
-                self.ax[1].plot(trace_processed, color=color, ls='--', label=f'Processed: {index}')
-                self.drawn_traces.append(trace_processed)
+                traces.append(('processed', self._processed_trace(index), '--', f'Processed: {index}'))
 
+        return traces
 
-    def _clear_plots(self):
-        for ax in self.ax:
-            del ax.lines[:]
-        self.drawn_traces = []
-        self._update_legend()
 
+    def _fast_trace_types(self):
+        if not isinstance(self.trace_sample, FastTrace):
+            return [None]
+        return [t for t, shown in [('high', self.window.showHighFastTrace), ('low', self.window.showLowFastTrace)] if shown]
+
+    def _process_traces(self, indices):
+        '''Processes the traces of the given channels at once, only the channels that are plotted are processed'''
+        if self.window.traceProcessing:
+            for fast_trace_type in self._fast_trace_types():
+                store = self._trace_store(fast_trace_type)
+                if store is None or store.get(self.trace_sample.index, indices) is None:
+                    processed_traces(self.trace_sample, self.trace_processing, indices, fast_trace_type, self.trace_processing_key)
+
+    def _processed_trace(self, index, fast_trace_type = None):
+        store = self._trace_store(fast_trace_type)
+        trace = None if store is None else store.get(self.trace_sample.index, index)
+        if trace is None:
+            trace = processed_traces(self.trace_sample, self.trace_processing, [index], fast_trace_type, self.trace_processing_key)[0]
+        return trace
+
+    def _fill_trace_stores(self):
+        if self.window.traceProcessing:
+            for fast_trace_type in self._fast_trace_types():
+                store = self._trace_store(fast_trace_type)
+                if store is not None:
+                    store.fill_around(self.trace_sample.index)
+
+    def _shutdown_trace_stores(self):
+        for store in self.trace_stores.values():
+            if store is not None:
+                store.shutdown()
+
+    def _trace_store(self, fast_trace_type):
+        '''The store of processed traces of the whole recording, filled around the cursor, None unless opted in'''
+        if fast_trace_type not in self.trace_stores:
+            store = None
+            directory = store_directory(self.platform)
+            if directory is not None and len(self.trace_processing.list_trace_processing) > 0:
+                store = ProcessedTraceStore(self.platform, self.ds_name, self.trace_processing, fast_trace_type, directory)
+                if not store.open(self.trace_sample):
+                    store = None
+            self.trace_stores[fast_trace_type] = store
+        return self.trace_stores[fast_trace_type]
+
+
+    def _update_waterfall(self, indices):
+        '''Streams the trace of the last selected channel over the frames around the cursor, in place of the plots'''
+        enabled = self.window.waterfall and len(indices) > 0
+        if self.waterfall_ax is None and enabled:
+            self.waterfall_ax = self.figure.add_axes(self.ax[1].get_position())
+        if self.waterfall_ax is not None and self.waterfall_ax.get_visible() != enabled:
+            self.waterfall_ax.set_visible(enabled)
+            self.ax[1].set_visible(not enabled)
+            self.blit_manager.invalidate()
+
+        fast_trace_types = self._fast_trace_types()
+        fast_trace_type = fast_trace_types[0] if fast_trace_types else 'high'
+        if enabled:
+            n_frames = len(self.datasource)
+            start = max(0, min(self.trace_sample.index - self.window.waterfallFrames//2, n_frames - self.window.waterfallFrames))
+            frames = range(start, min(start + self.window.waterfallFrames, n_frames))
+            channel = indices[-1]
+            key = (channel, frames, fast_trace_type, self.trace_processing_key if self.window.traceProcessing else None)
+        else:
+            key = None
+        if key == self.waterfall_key:
+            return
+
+        known = {}
+        if self.waterfall is not None:
+            self.waterfall.cancel()
+            # same trace, other frames: rows already read are reused
+            if key is not None and self.waterfall_key is not None and key[:1] + key[2:] == self.waterfall_key[:1] + self.waterfall_key[2:]:
+                known = self.waterfall.rows()
+        self.waterfall_key = key
+        self.waterfall = None
+        if key is None:
+            self.waterfall_timer.stop()
+            return
+
+        self.waterfall = WaterfallStream(self._waterfall_reader(channel, fast_trace_type), frames, known)
+        self.waterfall_shown = -1
+        self.waterfall_ax.set_title(f'{channel}: frames {frames.start} to {frames.stop - 1}')
+        self.waterfall_timer.start(WATERFALL_REFRESH_MS)
+
+
+    def _waterfall_reader(self, channel, fast_trace_type):
+        '''f(frame index) -> trace of the channel, as currently plotted (raw or processed), to be called by the stream'''
+        datasource = self.datasource
+        if not self.window.traceProcessing:
+            def read_trace(index):
+                raw = uncached_sample(datasource, index).raw
+                traces = raw if fast_trace_type is None else raw[fast_trace_type]
+                return np.array(traces['data'][channel])
+            return read_trace
+
+        trace_processing, key, store = self.trace_processing, self.trace_processing_key, self._trace_store(fast_trace_type)
+        def read_trace(index):
+            trace = None if store is None else store.get(index, channel)
+            if trace is None:
+                trace = processed_traces(uncached_sample(datasource, index), trace_processing, [channel], fast_trace_type, key)[0]
+            return trace
+        return read_trace
+
+
+    def _refresh_waterfall(self):
+        stream = self.waterfall
+        if stream is None:
+            return self.waterfall_timer.stop()
+        if stream.image is not None and stream.filled != self.waterfall_shown:
+            self.waterfall_shown = stream.filled
+            frames = self.waterfall_key[1]
+            extent = [0, stream.image.shape[1], frames.stop - 0.5, frames.start - 0.5]
+            if self.waterfall_image is None:
+                self.waterfall_image = self.waterfall_ax.imshow(stream.image, extent=extent, aspect='auto', interpolation='nearest')
+            else:
+                self.waterfall_image.set_data(stream.image)
+                self.waterfall_image.set_extent(extent)
+            filled = stream.image[:stream.filled]
+            if filled.size > 0 and np.isfinite(filled).any():
+                self.waterfall_image.set_clim(np.nanmin(filled), np.nanmax(filled))
+            self._draw()
+        if stream.done:
+            self.waterfall_timer.stop()
 
 
     def _placeholder_echo_sample(self):
 
+        index, echo_sample = self.placeholder
+        if index == self.trace_sample.index:
+            return echo_sample
+
         if isinstance(self.trace_sample, FastTrace):
             traces_raw = self.trace_sample.raw['high']
         else:
             traces_raw = self.trace_sample.raw
 
-        v, h = self.trace_sample.specs['v'], self.trace_sample.specs['h']
-        vv, hh = np.mgrid[0:v, 0:h]
-        coords_img = np.stack((vv,hh, np.arange(0, v*h).reshape(v, h)), axis=2)[...,2]
-        coords_img_tf = np.flipud(coords_img)
-        indices = coords_img_tf.flatten()
-        amplitudes = np.max(traces_raw['data'], axis=1)[indices]
-        distances = np.argmax(traces_raw['data'], axis=1)[indices]*traces_raw['distance_scaling']
+        indices = placeholder_indices(self.trace_sample.specs['v'], self.trace_sample.specs['h'])
+        peaks = np.argmax(traces_raw['data'], axis=1)[indices]
+        amplitudes = traces_raw['data'][indices, peaks]
+        distances = peaks*traces_raw['distance_scaling']
         try:
             distances += traces_raw['time_base_delays'][indices]
         except:
@@ -313,4 +519,6 @@ class TracesWindow(Window):
             specs = self.trace_sample.specs
         )
 
-        return Echo(self.trace_sample.index, self.trace_sample.datasource, raw, self.trace_sample.timestamp)
\ No newline at end of file
+        echo_sample = Echo(self.trace_sample.index, self.trace_sample.datasource, raw, self.trace_sample.timestamp)
+        self.placeholder = (self.trace_sample.index, echo_sample)
+        return echo_sample
\ No newline at end of file
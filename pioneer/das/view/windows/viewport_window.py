@@ -1,13 +1,15 @@
-from pioneer.common import linalg, clouds
 from pioneer.common import platform as platform_utils
-from pioneer.common.gui import CustomActors, utils
+from pioneer.common.gui import CustomActors
 from pioneer.common.video import VideoRecorder, RecordableInterface
 from pioneer.das.api import categories, lane_types
 from pioneer.das.api.samples import Echo
 from pioneer.das.api.samples.annotations.box_3d import Box3d
 from pioneer.das.api.samples.point_cloud import PointCloud
 from pioneer.das.api.samples.sample import Sample
+from pioneer.das.view.frustrum_cache import frustrum_geometry
+from pioneer.das.view.point_colors import rgb_field_colors, to_float_colors
 from pioneer.das.view.windows import Window
+from pioneer.das.view.windows.actor_pools import BoxActorPool, TextActorPool
 
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtGui import QColor
@@ -25,6 +27,7 @@ class ViewportWindow(Window, RecordableInterface):
         self.controls = self.window.controls
         self.ds_name = ds_name
         self.video_recorder = VideoRecorder.create(self, ds_name, platform, synchronized, video_fps)
+        self.box_pools = {}
 
     def on_video_created(self):
         """Overrided"""
@@ -81,18 +84,7 @@ class ViewportWindow(Window, RecordableInterface):
 
         if 'ech' in ds_type and not hasattr(self, 'frustrum'):
 
-            lcax = self.sample.datasource.sensor
-            specs = self.sample.specs
-
-            if lcax.angle_chart:
-                cache = self.sample.cache()
-                correct_v_angles = lcax.get_corrected_projection_data(self.sample.timestamp, cache, 'angles')
-
-                v_cell_size, h_cell_size = clouds.v_h_cell_size_rad(specs)
-
-                i, v = clouds.frustrum(clouds.custom_frustrum_directions(correct_v_angles, v_cell_size, h_cell_size, dtype=np.float64), 40)
-            else:
-                i, v = clouds.frustrum(clouds.frustrum_directions(specs['v_fov'], specs['h_fov'], dtype=np.float64))
+            i, v = frustrum_geometry(self.sample)
 
             if self.sample.orientation is not None:
                 v = (self.sample.orientation @ v.T).T
@@ -110,7 +102,7 @@ class ViewportWindow(Window, RecordableInterface):
             package = actor['packages']
             cloud = actor['cloud']
             sensor = self.platform.sensors[platform_utils.extract_sensor_id(datasource)]
-            sensor.extrinsics_dirty.connect(cloud.makeDirty)
+            sensor.extrinsics_dirty.connect(cloud.invalidate)
             if datasource != self.ds_name:
                 ref_sensor = self.platform.sensors[platform_utils.extract_sensor_id(self.ds_name)]
                 ref_sensor.extrinsics_dirty.connect(sensor.extrinsics_dirty)
@@ -122,11 +114,7 @@ class ViewportWindow(Window, RecordableInterface):
             cloud.sample.variant = sample
 
             if '-rgb' in datasource: #TODO: generalize how colors are obtained from the sample
-                colors = np.ones((sample.size,4))
-                colors[:,0] = sample.get_field('r')/255
-                colors[:,1] = sample.get_field('g')/255
-                colors[:,2] = sample.get_field('b')/255
-                cloud._colors.set_ndarray(colors)
+                cloud.setPointColors(to_float_colors(rgb_field_colors(sample)))
 
             if isinstance(sample, Echo):
                 package.variant = sample.masked  # FIXME: port 2d viewers to das.api too
@@ -202,57 +190,58 @@ class ViewportWindow(Window, RecordableInterface):
     def _draw_bounding_box_actors(self):
 
         for ds_name, actors in self.viewport.bboxActors.items():
-            actors['actor'].clearActors()
-            if not self.controls.showBBox3D[ds_name]: continue
-
-            box_source = categories.get_source(platform_utils.parse_datasource_name(ds_name)[2])
-            box3d_sample:Box3d = self.platform[ds_name].get_at_timestamp(self.sample.timestamp)
-            if np.abs(float(box3d_sample.timestamp) - float(self.sample.timestamp)) > 1e6: continue
-            box3d = box3d_sample.set_referential(self.ds_name, ignore_orientation=True)
-            category_numbers = box3d.get_category_numbers()
-
-            for box_index in range(len(box3d)):
-
-                center = box3d.get_centers()[box_index]
-                dimension = box3d.get_dimensions()[box_index]
-                rotation = box3d.get_rotations()[box_index]
-                confidence = box3d.get_confidences()[box_index]
-                category_name, color = categories.get_name_color(box_source, category_numbers[box_index])
-                id = box3d.get_ids()[box_index]
-
-                if confidence:
-                    if confidence < int(self.controls.confThreshold) / 100.0: continue
-
-                if self.controls.categoryFilter is not '':
-                    if category_name not in self.controls.categoryFilter: continue
-
-                color = QColor.fromRgb(*color)
-                text_color = QColor('white')
-                if self.controls.useBoxColors:
-                    text_color = color = QColor(self.controls.box3DColors[ds_name])
-
-                bbox_actor, text_anchor = CustomActors.bbox(center, dimension, rotation, color=color, return_anchor=True)
-                bbox_actor.effect.lineWidth = 2
-
-                tf = linalg.tf_from_pos_euler(text_anchor)
-
-                actors['actor'].addActor(bbox_actor)
-
-                if self.controls.boxLabelsSize > 0:
-                    text_label = category_name
-                    if id: text_label += f" {id}"
-                    if confidence: text_label += f" ({int(confidence)}%)"
-                    text_actor = CustomActors.text(text_label,
-                        color=text_color,
-                        origin=[0, 0, 0], v=[0, -1, 0],
-                        matrix=utils.from_numpy(tf),
-                        scale=0.1,
-                        font_size=self.controls.boxLabelsSize,
-                        line_width=3,
-                        is_billboard=True,
-                    )
-
-                    actors['actor'].addActor(text_actor)
+            if ds_name not in self.box_pools:
+                self.box_pools[ds_name] = (BoxActorPool(actors['actor']), TextActorPool(actors['actor']))
+            box_pool, text_pool = self.box_pools[ds_name]
+
+            boxes, labels = self._get_bounding_boxes(ds_name)
+            anchors = box_pool.update(*boxes)
+            if self.controls.boxLabelsSize > 0:
+                text_pool.update(labels[0], anchors, labels[1], self.controls.boxLabelsSize)
+            else:
+                text_pool.acquire(0)
+
+    def _get_bounding_boxes(self, ds_name):
+        '''Returns ((centers, dimensions, rotations, colors), (labels, text colors)) of the boxes to draw'''
+        empty = ((np.zeros((0,3)), np.zeros((0,3)), np.zeros((0,3)), []), ([], []))
+        if not self.controls.showBBox3D[ds_name]: return empty
+
+        box_source = categories.get_source(platform_utils.parse_datasource_name(ds_name)[2])
+        box3d_sample:Box3d = self.platform[ds_name].get_at_timestamp(self.sample.timestamp)
+        if np.abs(float(box3d_sample.timestamp) - float(self.sample.timestamp)) > 1e6: return empty
+        box3d = box3d_sample.set_referential(self.ds_name, ignore_orientation=True)
+        category_numbers = box3d.get_category_numbers()
+        confidences = box3d.get_confidences()
+        ids = box3d.get_ids()
+
+        keep, colors, labels, text_colors = [], [], [], []
+        for box_index in range(len(box3d)):
+
+            confidence = confidences[box_index]
+            category_name, color = categories.get_name_color(box_source, category_numbers[box_index])
+            id = ids[box_index]
+
+            if confidence:
+                if confidence < int(self.controls.confThreshold) / 100.0: continue
+
+            if self.controls.categoryFilter != '':
+                if category_name not in self.controls.categoryFilter: continue
+
+            color = QColor.fromRgb(*color)
+            text_color = QColor('white')
+            if self.controls.useBoxColors:
+                text_color = color = QColor(self.controls.box3DColors[ds_name])
+
+            text_label = category_name
+            if id: text_label += f" {id}"
+            if confidence: text_label += f" ({int(confidence)}%)"
+
+            keep.append(box_index)
+            colors.append(color)
+            labels.append(text_label)
+            text_colors.append(text_color)
+
+        return (box3d.get_centers()[keep], box3d.get_dimensions()[keep], box3d.get_rotations()[keep], colors), (labels, text_colors)
 
 
     def _draw_lane_actors(self):
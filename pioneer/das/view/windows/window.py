@@ -1,5 +1,5 @@
 from abc import abstractmethod
-from PyQt5.QtCore import QObject
+from PyQt5.QtCore import QCoreApplication, QObject
 
 class Window(object):
 
@@ -9,6 +9,9 @@ class Window(object):
         self.connections = []
 
         self.window.visibleChanged.connect(self.handle_visible_changed)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.release)
 
     def add_connection(self, connection):
         self.connections.append(connection)
@@ -18,11 +21,16 @@ class Window(object):
             self.connect()
         else:
             self.__disconnect()
+            self.release()
 
     @abstractmethod
     def connect(self):
         raise NotImplementedError()
 
+    def release(self):
+        '''Stops the background work of the window (threads, processes), when it is hidden or the application quits'''
+        pass
+
     def __disconnect(self):
         for c in self.connections:
             QObject.disconnect(c)
@@ -0,0 +1,59 @@
+from pioneer.das.view.accumulation import SweepAccumulator, even_subsample
+
+import numpy as np
+
+class Sweeps(object):
+    '''Datasource of random sweeps of varying sizes, counting the sweeps read'''
+    def __init__(self, n):
+        rng = np.random.RandomState(0)
+        self.sweeps = [(rng.normal(size = (s, 3)), rng.uniform(size = s)) for s in rng.randint(50, 200, n)]
+        self.reads = []
+
+    def __getitem__(self, i):
+        return i
+
+    def get_sweep(self, i):
+        self.reads.append(i)
+        return self.sweeps[i]
+
+def reference(sweeps, index, n_sweeps, max_points):
+    per_sweep = max(max_points // n_sweeps, 1)
+    selected = [sweeps.sweeps[i] for i in range(max(index - n_sweeps + 1, 0), index + 1)]
+    keeps = [even_subsample(points.shape[0], per_sweep) for points, _ in selected]
+    return (np.concatenate([points[keep] for (points, _), keep in zip(selected, keeps)])
+          , np.concatenate([amplitudes[keep] for (_, amplitudes), keep in zip(selected, keeps)]))
+
+def test_even_subsample():
+    assert np.array_equal(even_subsample(5, 10), np.arange(5))
+    indices = even_subsample(100, 10)
+    assert indices.size == 10 and indices[0] == 0 and indices[-1] == 99
+
+def test_matches_concatenated_sweeps():
+    sweeps = Sweeps(20)
+    for n_sweeps, max_points in [(1, 1000), (5, 1000), (5, 300), (30, 10000)]:
+        accumulator = SweepAccumulator()
+        for index in [0, 3, 10, 19]:
+            points, amplitudes = accumulator.update(sweeps, index, n_sweeps, sweeps.get_sweep, max_points)
+            expected = reference(sweeps, index, n_sweeps, max_points)
+            assert np.array_equal(points, expected[0]) and np.array_equal(amplitudes, expected[1])
+
+def test_stepping_forward_reads_only_the_new_sweep():
+    sweeps = Sweeps(20)
+    accumulator = SweepAccumulator()
+    accumulator.update(sweeps, 5, 4, sweeps.get_sweep, 1000)
+    sweeps.reads.clear()
+    for index in range(6, 12):
+        points, _ = accumulator.update(sweeps, index, 4, sweeps.get_sweep, 1000)
+        assert np.array_equal(points, reference(sweeps, index, 4, 1000)[0])
+    assert sweeps.reads == list(range(6, 12))
+    assert sorted(accumulator.sweeps) == list(range(8, 12))
+
+def test_params_change_clears_the_sweeps():
+    sweeps = Sweeps(10)
+    accumulator = SweepAccumulator()
+    accumulator.update(sweeps, 5, 3, sweeps.get_sweep, params = ('a',))
+    sweeps.reads.clear()
+    accumulator.update(sweeps, 5, 3, sweeps.get_sweep, params = ('a',))
+    assert sweeps.reads == []
+    accumulator.update(sweeps, 5, 3, sweeps.get_sweep, params = ('b',))
+    assert sweeps.reads == [3, 4, 5]
@@ -0,0 +1,43 @@
+from pioneer.das.view.caches import LRUCache, nbytes
+
+import numpy as np
+
+def test_evicts_least_recently_used():
+    evicted = []
+    cache = LRUCache(max_items = 2, on_evict = lambda k, v: evicted.append(k))
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert evicted == ['b']
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+
+def test_byte_accounting():
+    cache = LRUCache(max_bytes = 3000)
+    a, b, c = (np.zeros(100, 'f8') for _ in range(3))
+    cache.put('a', a)
+    cache.put('b', (b, {'x': np.zeros(10, 'u1')}))
+    assert cache.size_bytes == 800 + 810
+    cache.put('a', np.zeros(50, 'f8')) # replacing an entry releases its bytes
+    assert cache.size_bytes == 400 + 810
+    cache.put('c', c)
+    cache.put('d', np.zeros(200, 'f8'))
+    assert 'b' not in cache and 'a' in cache # 'a' was refreshed by its replacement
+    assert cache.size_bytes == sum(nbytes(cache.get(k)) for k in ['a', 'c', 'd']) == 400 + 800 + 1600
+    cache.pop('c')
+    assert cache.size_bytes == 2000
+    cache.clear()
+    assert cache.size_bytes == 0 and len(cache) == 0
+
+def test_oversized_values_are_not_cached():
+    cache = LRUCache(max_bytes = 100)
+    value = np.zeros(100, 'f8')
+    assert cache.put('a', value) is value
+    assert 'a' not in cache and cache.size_bytes == 0
+
+def test_invalidate():
+    cache = LRUCache()
+    for i in range(5):
+        cache.put(('ds', i), np.zeros(i, 'u1'))
+    cache.invalidate(lambda key: key[1] % 2 == 0)
+    assert len(cache) == 2 and cache.size_bytes == 1 + 3
@@ -0,0 +1,53 @@
+from pioneer.das.view.decimation import TopAmplitudes, morton_codes, voxel_decimation
+
+import numpy as np
+
+def test_voxel_decimation_respects_budget():
+    rng = np.random.RandomState(0)
+    points = np.concatenate([rng.normal(0, 0.1, (5000, 3)), rng.uniform(-50, 50, (500, 3))])
+    points[::97] = np.nan
+    for budget in [0, 1, 100, 1000, 4000]:
+        indices = voxel_decimation(points, budget)
+        assert indices.size <= budget
+        assert np.all(np.diff(indices) > 0)
+        assert np.isfinite(points[indices]).all()
+
+def test_voxel_decimation_keeps_sparse_points():
+    rng = np.random.RandomState(1)
+    dense = rng.normal(0, 0.01, (10000, 3))
+    sparse = np.array([[100., 0, 0], [0, 100., 0], [0, 0, 100.], [-100., -100., -100.]])
+    points = np.concatenate([dense, sparse])
+    indices = voxel_decimation(points, 500)
+    assert set(range(dense.shape[0], points.shape[0])) <= set(indices.tolist())
+
+def test_voxel_decimation_small_clouds():
+    points = np.random.RandomState(2).normal(size = (10, 3))
+    assert np.array_equal(voxel_decimation(points, 10), np.arange(10))
+
+def test_morton_codes_nest_voxels():
+    points = np.random.RandomState(3).uniform(0, 1, (1000, 3))
+    codes = morton_codes(points)
+    # points in the same voxel at a level are in the same voxel at all coarser levels
+    for level in range(1, 5):
+        fine = codes >> np.uint64(3 * level)
+        coarse = codes >> np.uint64(3 * (level + 1))
+        for voxel in np.unique(fine)[:50]:
+            assert np.unique(coarse[fine == voxel]).size == 1
+
+def test_top_amplitudes_matches_argsort():
+    rng = np.random.RandomState(4)
+    amplitudes = rng.uniform(0, 1, 1000)
+    top = TopAmplitudes()
+    reference = np.argsort(amplitudes, kind = 'stable')
+    for key, k in [('a', 10), ('a', 10), ('a', 250), ('a', 1000), ('a', 0), ('b', 999), ('b', 2000)]:
+        indices = top.top(key, amplitudes, k)
+        k = min(k, amplitudes.size)
+        assert indices.size == k
+        assert set(indices.tolist()) == set(reference[amplitudes.size - k:].tolist())
+
+def test_top_amplitudes_new_key():
+    top = TopAmplitudes()
+    a, b = np.arange(10.), np.arange(10.)[::-1].copy()
+    top.top('a', a, 3)
+    top.top('a', a, 4)
+    assert set(top.top('b', b, 3).tolist()) == {0, 1, 2}
@@ -0,0 +1,29 @@
+from pioneer.das.view.geometry import bboxes_to_8coordinates, euler_to_matrices
+
+import numpy as np
+import pytest
+
+def random_boxes(n, seed = 0):
+    rng = np.random.RandomState(seed)
+    return rng.uniform(-20, 20, (n, 3)), rng.uniform(0.5, 5, (n, 3)), rng.uniform(-np.pi, np.pi, (n, 3))
+
+def test_euler_to_matrices_matches_transforms3d():
+    euler = pytest.importorskip('transforms3d.euler')
+    _, _, r_xyz = random_boxes(50)
+    matrices = euler_to_matrices(r_xyz)
+    for r, matrix in zip(r_xyz, matrices):
+        assert np.allclose(matrix, euler.euler2mat(*r))
+
+def test_bboxes_to_8coordinates_matches_per_box():
+    linalg = pytest.importorskip('pioneer.common.linalg')
+    c_xyz, d_xyz, r_xyz = random_boxes(50)
+    corners = bboxes_to_8coordinates(c_xyz, d_xyz, r_xyz)
+    assert corners.shape == (50, 8, 3)
+    for c, d, r, box in zip(c_xyz, d_xyz, r_xyz, corners):
+        assert np.allclose(box, linalg.bbox_to_8coordinates(c, d, r))
+
+def test_single_box():
+    corners = bboxes_to_8coordinates([1, 2, 3], [2, 4, 6], [0, 0, 0])
+    assert corners.shape == (1, 8, 3)
+    assert np.allclose(corners[0].min(axis=0), [0, 0, 0]) and np.allclose(corners[0].max(axis=0), [2, 4, 6])
+    assert np.allclose(corners[0,7], [2, 4, 6])
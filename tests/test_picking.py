@@ -0,0 +1,25 @@
+from pioneer.das.view.picking import ChannelEchoes
+
+import numpy as np
+
+def test_channel_echoes_match_flatnonzero():
+    rng = np.random.RandomState(0)
+    n_channels = 64
+    indices = rng.randint(0, n_channels - 8, 500) # some channels have several echoes, the last ones have none
+    lookup = ChannelEchoes(indices, n_channels)
+    for c in range(n_channels):
+        assert np.array_equal(lookup.echoes(c), np.flatnonzero(indices == c))
+        assert lookup.count(c) == np.count_nonzero(indices == c)
+
+def test_channel_echoes_out_of_range():
+    lookup = ChannelEchoes(np.array([0, 3, 3]), 4)
+    assert lookup.echoes(-1).size == 0 and lookup.echoes(4).size == 0
+    assert np.array_equal(lookup.echoes(3), [1, 2])
+
+def test_channel_echoes_beyond_n_channels():
+    lookup = ChannelEchoes(np.array([5, 1]), 4)
+    assert np.array_equal(lookup.echoes(5), [0])
+
+def test_channel_echoes_empty():
+    lookup = ChannelEchoes(np.zeros(0, 'u4'), 8)
+    assert all(lookup.count(c) == 0 for c in range(8))
@@ -0,0 +1,29 @@
+from pioneer.common import clouds
+from pioneer.das.view.quad_cloud import quad_cloud, quad_indices
+
+import numpy as np
+
+def echoes(v = 8, h = 32, n = 300, seed = 0):
+    rng = np.random.RandomState(seed)
+    quad_directions = rng.normal(size = (4 * v * h, 3))
+    selection = rng.randint(0, v * h, n)
+    return selection, rng.uniform(1, 50, n), rng.uniform(0, 1000, n), quad_directions
+
+def test_matches_to_quad_cloud():
+    v, h = 8, 32
+    for dtype in [np.float32, np.float64]:
+        selection, distances, amplitudes, quad_directions = echoes(v, h)
+        points, quad_amplitudes, indices = quad_cloud(selection, distances, amplitudes, quad_directions, dtype)
+        expected = clouds.to_quad_cloud(selection, distances, amplitudes, quad_directions, v, h, dtype)
+        assert points.dtype == expected[0].dtype and quad_amplitudes.dtype == expected[1].dtype
+        assert np.allclose(points, expected[0]) and np.allclose(quad_amplitudes, expected[1])
+        assert np.array_equal(indices, expected[2])
+
+def test_empty_selection():
+    selection, distances, amplitudes, quad_directions = echoes(n = 0)
+    points, quad_amplitudes, indices = quad_cloud(selection, distances, amplitudes, quad_directions)
+    assert points.shape == (0, 3) and quad_amplitudes.shape == (0, 1) and indices.size == 0
+
+def test_quad_indices_are_cached():
+    assert quad_indices(100) is quad_indices(100)
+    assert quad_indices(101).size == 6 * 101
@@ -0,0 +1,59 @@
+from pioneer.das.view.rasterize import CloudRaster, disk_offsets
+
+import numpy as np
+
+RED, GREEN, BLUE = np.eye(4)[:3] + [0, 0, 0, 1]
+
+def raster(shape = (20, 30)):
+    r = CloudRaster()
+    r.reset(shape)
+    return r
+
+def test_nearest_point_wins_regardless_of_order():
+    pts = np.array([[5.5, 5.5], [5.2, 5.7], [5.9, 5.1]])
+    depths = np.array([3., 1., 2.])
+    colors = np.array([RED, GREEN, BLUE])
+    for order in [[0, 1, 2], [2, 1, 0], [1, 0, 2]]:
+        r = raster()
+        for i in order: # one call per point, then a single call
+            r.add_points(pts[[i]], depths[[i]], colors[[i]])
+        assert np.array_equal(r.rgba[5, 5], [0, 255, 0, 255]) and r.depth[5, 5] == 1
+        r = raster()
+        r.add_points(pts[order], depths[order], colors[order])
+        assert np.array_equal(r.rgba[5, 5], [0, 255, 0, 255]) and r.depth[5, 5] == 1
+
+def test_points_outside_are_dropped():
+    r = raster()
+    r.add_points(np.array([[-1., 0], [0, -1.], [30., 0], [0, 20.]]), np.ones(4), np.array([RED] * 4))
+    assert r.is_empty()
+
+def test_disk_radius():
+    dx, dy = disk_offsets(2)
+    r = raster()
+    r.add_points(np.array([[10.5, 10.5]]), np.ones(1), np.array([RED]), radius = 2)
+    assert (r.rgba[..., 3] > 0).sum() == dx.size
+    assert r.rgba[10, 12, 0] == 255 and r.rgba[12, 12, 0] == 0
+
+def test_triangles_depth_ordering():
+    far = np.array([[[0., 0], [30., 0], [0., 20.]]])
+    near = np.array([[[2., 2], [12., 2], [2., 12.]]])
+    for triangles, depths, colors in [(np.concatenate([far, near]), np.array([5., 1.]), np.array([RED, GREEN]))
+                                    , (np.concatenate([near, far]), np.array([1., 5.]), np.array([GREEN, RED]))]:
+        r = raster()
+        r.add_triangles(triangles, depths, colors)
+        assert np.array_equal(r.rgba[4, 4], [0, 255, 0, 255])
+        assert np.array_equal(r.rgba[1, 20], [255, 0, 0, 255])
+        assert r.rgba[19, 29, 3] == 0 # outside of both
+
+def test_point_hidden_by_nearer_triangle():
+    r = raster()
+    r.add_triangles(np.array([[[0., 0], [30., 0], [0., 20.]]]), np.array([1.]), np.array([RED]))
+    r.add_points(np.array([[3.5, 3.5], [25.5, 15.5]]), np.array([2., 2.]), np.array([GREEN, GREEN]))
+    assert np.array_equal(r.rgba[3, 3], [255, 0, 0, 255])
+    assert np.array_equal(r.rgba[15, 25], [0, 255, 0, 255])
+
+def test_reset_clears():
+    r = raster()
+    r.add_points(np.array([[1., 1.]]), np.ones(1), np.array([RED]))
+    r.reset((20, 30))
+    assert r.is_empty() and not r.rgba.any()
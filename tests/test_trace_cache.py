@@ -0,0 +1,102 @@
+from pioneer.common.trace_processing import TraceProcessing, TraceProcessingCollection, Binning, Clip, CutInterval, Decimate\
+    , Desaturate, Realign, RemoveStaticNoise, Smooth, ZeroBaseline
+from pioneer.das.view.trace_cache import processed_traces, processing_key
+
+import copy
+import itertools
+import numpy as np
+
+N_CHANNELS, LENGTH = 24, 128
+
+_labels = itertools.count()
+
+class Datasource(object):
+    def __init__(self):
+        self.label = f'test_{next(_labels)}' # a new frame for each sample, so that tests do not share cached traces
+
+class TraceSample(object):
+    '''Same processed() as pioneer.das.api.samples.Trace, on synthetic traces'''
+    def __init__(self, raw):
+        self.datasource = Datasource()
+        self.index = 0
+        self.raw = raw
+        self.n_processed = 0
+
+    def processed(self, trace_processing):
+        self.n_processed += 1
+        return trace_processing(copy.deepcopy(self.raw))
+
+class FastTraceSample(TraceSample):
+    '''Same processed() as pioneer.das.api.samples.FastTrace'''
+    def processed(self, trace_processing):
+        self.n_processed += 1
+        raw_copy = copy.deepcopy(self.raw)
+        return {fast_trace_type: trace_processing(raw_copy[fast_trace_type]) for fast_trace_type in ['low', 'high']}
+
+def traces(seed = 0):
+    rng = np.random.RandomState(seed)
+    x = np.arange(LENGTH)
+    data = 20 * rng.uniform(size = (N_CHANNELS, LENGTH))
+    for c in range(N_CHANNELS):
+        data[c] += 300 * np.exp(-0.5 * ((x - rng.uniform(20, 100)) / 3)**2)
+    data[7, 50:60] = data[15, 70:78] = data.max() + 100 # saturation plateaus, the frame maximum is not in channel 0
+    return {'data': data
+          , 'time_base_delays': rng.uniform(0, 3, N_CHANNELS)
+          , 'distance_scaling': 0.5
+          , 'trace_smoothing_kernel': np.array([0.25, 0.5, 0.25])}
+
+def per_channel_steps(static_noise):
+    return [RemoveStaticNoise(static_noise), Desaturate(), Realign(), ZeroBaseline(), CutInterval(4, -4), Smooth()
+          , Binning(2), Decimate(2), Clip(0, 250)]
+
+def assert_matches_full_frame(sample, trace_processing, channels, fast_trace_type = None):
+    full = sample.processed(trace_processing)
+    expected = (full if fast_trace_type is None else full[fast_trace_type])['data'][channels]
+    assert np.allclose(processed_traces(sample, trace_processing, channels, fast_trace_type), expected)
+
+def test_per_channel_steps_match_full_frame():
+    noise = np.random.RandomState(1).uniform(0, 5, (N_CHANNELS, LENGTH))
+    trace_processing = TraceProcessingCollection(per_channel_steps(noise))
+    for channels in [[0], [3, 7], [15, 2, 15], list(range(N_CHANNELS))]:
+        assert_matches_full_frame(TraceSample(traces()), trace_processing, channels)
+
+def test_each_step_matches_full_frame():
+    noise = np.random.RandomState(1).uniform(0, 5, LENGTH) # a single trace of static noise is broadcast
+    for step in per_channel_steps(noise):
+        assert_matches_full_frame(TraceSample(traces()), TraceProcessingCollection([step]), [1, 7, 20])
+
+class Normalize(TraceProcessing):
+    '''A frame-wide step, which is not processed per channel'''
+    def __call__(self, traces):
+        traces['data'] = traces['data'] / traces['data'].max()
+        return traces
+
+def test_frame_wide_steps_process_the_full_frame():
+    trace_processing = TraceProcessingCollection([ZeroBaseline(), Normalize()])
+    sample = TraceSample(traces())
+    assert_matches_full_frame(sample, trace_processing, [2, 5])
+
+def test_fast_traces():
+    sample = FastTraceSample({'high': traces(0), 'low': traces(1)})
+    trace_processing = TraceProcessingCollection([Desaturate(), Realign(), ZeroBaseline()])
+    for fast_trace_type in ['high', 'low']:
+        assert_matches_full_frame(sample, trace_processing, [4, 9], fast_trace_type)
+
+def test_processed_channels_are_cached():
+    sample = TraceSample(traces())
+    trace_processing = TraceProcessingCollection([ZeroBaseline(), Normalize()])
+    first = processed_traces(sample, trace_processing, [2, 5])
+    n_processed = sample.n_processed
+    # an equal chain, rebuilt with equal parameters, finds the same traces
+    rebuilt = TraceProcessingCollection([ZeroBaseline(), Normalize()])
+    second = processed_traces(sample, rebuilt, [5, 2])
+    assert sample.n_processed == n_processed
+    assert second[0] is first[1] and second[1] is first[0]
+
+def test_processing_key_is_content_based():
+    noise = np.arange(LENGTH, dtype = 'f8')
+    key = processing_key(TraceProcessingCollection([RemoveStaticNoise(noise), Clip(0, 10)]))
+    assert key == processing_key(TraceProcessingCollection([RemoveStaticNoise(noise.copy()), Clip(0, 10)]))
+    assert key != processing_key(TraceProcessingCollection([RemoveStaticNoise(noise + 1), Clip(0, 10)]))
+    assert key != processing_key(TraceProcessingCollection([RemoveStaticNoise(noise), Clip(0, 20)]))
+    hash(key)